@@ -0,0 +1,81 @@
+import typing
+
+from fastapi import APIRouter, Depends, Query, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from config import settings
+from auth.auth import current_active_user, UserSnapshot
+from schemas.area_schemas import AreaSchema, NearbyAreaSchema
+from .crud import get_areas_near
+from .importer import import_areas, iter_lines, parse_csv, parse_ndjson
+
+router = APIRouter(prefix="/area", tags=["area"])
+
+
+@router.get("/near", response_model=typing.List[NearbyAreaSchema])
+async def areas_near(
+    lat: float = Query(ge=-90, le=90),
+    lon: float = Query(ge=-180, le=180),
+    radius_km: float = Query(gt=0, le=500),
+    limit: int = Query(20, gt=0, le=100),
+    user: UserSnapshot = Depends(current_active_user),
+):
+    nearby = await get_areas_near(user.id, lat, lon, radius_km, limit)
+    return [
+        NearbyAreaSchema(area=AreaSchema.model_validate(area), distance_km=distance)
+        for area, distance in nearby
+    ]
+
+
+class ImportProgressResponse(StreamingResponse):
+    """Streams progress while the request body is still being read.
+
+    StreamingResponse listens for the client disconnect on ``receive``, which
+    would swallow the body messages the import is consuming; a disconnect
+    surfaces from ``request.stream()`` instead."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+IMPORT_PARSERS = {
+    "application/x-ndjson": parse_ndjson,
+    "application/jsonl": parse_ndjson,
+    "text/csv": parse_csv,
+}
+
+
+@router.post("/import")
+async def import_areas_stream(
+    request: Request,
+    header: bool = Query(True, description="CSV only: skip the first line"),
+    user: UserSnapshot = Depends(current_active_user),
+):
+    """Bulk import of areas with nested rooms from an NDJSON or CSV body.
+
+    NDJSON lines are area objects with an optional ``rooms`` list of
+    ``{"name": ...}``; CSV columns are name, latitude, longtitude, address,
+    rooms (room names separated by ``|``). The response is NDJSON with one
+    progress object per chunk followed by the totals (``"done": true``)."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    parse = IMPORT_PARSERS.get(content_type)
+    if parse is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Use one of: {', '.join(IMPORT_PARSERS)}",
+        )
+
+    async def progress():
+        async for report in import_areas(
+            iter_lines(request.stream()),
+            parse,
+            user.id,
+            settings.area.import_chunk_size,
+            skip_header=header and parse is parse_csv,
+        ):
+            yield report.model_dump_json() + "\n"
+
+    return ImportProgressResponse(progress(), media_type="application/x-ndjson")
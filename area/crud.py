@@ -1,16 +1,19 @@
+import math
 import typing
 from decimal import Decimal
 
-from sqlalchemy import select, insert, func
+from sqlalchemy import select, insert, func, or_, and_
 from sqlalchemy.orm import selectinload
 
-from db.session import async_session_maker
-from models.area import Area, Room
+from config import settings
+from db.session import async_session_maker, async_read_session_maker
+from models.area import Area, Room, area_rtree
 from graphql_schemas.area import Room as RoomSchema
+from utils.geo import bounding_box, haversine_km
 
 
 async def get_area_by_id(area_id: int, user_id: int):
-    async with async_session_maker() as session:
+    async with async_read_session_maker() as session:
         stmt = (
             select(Area)
             .where(Area.id == area_id, Area.user_id == user_id)
@@ -26,26 +29,48 @@ async def get_my_areas(
     limit: int,
     offset: int,
     keys: typing.Optional[typing.List[int]] = None,
+    with_items: bool = True,
+    with_count: bool = True,
 ):
-    async with async_session_maker() as session:
-        stmt = (
-            select(Area)
-            .filter(Area.user_id == user_id)
-            .options(selectinload(Area.rooms))
-            .offset(offset)
-            .limit(limit)
-        )
-        count_stmt = select(func.count()).filter(Area.user_id == user_id)
-        if keys:
-            stmt = stmt.filter(Area.id.in_(keys))
-            count_stmt = count_stmt.filter(Area.id.in_(keys))
+    conditions = [Area.user_id == user_id]
+    if keys:
+        conditions.append(Area.id.in_(keys))
+    count_stmt = select(func.count()).select_from(Area).where(*conditions)
+    async with async_read_session_maker() as session:
+        if not with_items:
+            if not with_count:
+                return [], None
+            return [], (await session.execute(count_stmt)).scalar_one()
+        stmt = select(Area).where(*conditions).offset(offset).limit(limit)
+        if with_count:
+            # total rides along with the page, computed before LIMIT/OFFSET
+            stmt = stmt.add_columns(func.count().over().label("total"))
+        rows = (await session.execute(stmt)).all()
+        count = None
+        if with_count:
+            count = rows[0].total if rows else 0
+            if not rows and offset:
+                # past the last page there is no row to carry the total
+                count = (await session.execute(count_stmt)).scalar_one()
+    return [row.Area for row in rows], count
+
+
+async def get_areas_by_ids(user_id: int, ids: typing.List[int]):
+    async with async_read_session_maker() as session:
+        stmt = select(Area).where(Area.user_id == user_id, Area.id.in_(ids))
+        results = await session.execute(stmt)
+    return results.scalars().all()
+
+
+async def get_rooms_by_area_ids(area_ids: typing.List[int]):
+    async with async_read_session_maker() as session:
+        stmt = select(Room).where(Room.area_id.in_(area_ids)).order_by(Room.id)
         results = await session.execute(stmt)
-        count = await session.execute(count_stmt)
-    return results.scalars().all(), count.scalar_one_or_none()
+    return results.scalars().all()
 
 
 async def get_my_rooms(user_id: int):
-    async with async_session_maker() as session:
+    async with async_read_session_maker() as session:
         stmt = select(Room).join(Room.area).where(Area.user_id == user_id)
         results = await session.execute(stmt)
     return results.scalars().all()
@@ -70,16 +95,81 @@ async def create_rooms(rooms: typing.List[dict]):
 
 async def create_area(
     name: str, latitude: Decimal, longtitude: Decimal, address: str, user_id: int
-) -> object:
+) -> Area:
     async with async_session_maker() as session:
-        area = Area(
-            name=name,
-            latitude=latitude,
-            longtitude=longtitude,
-            address=address,
-            user_id=user_id,
+        stmt = (
+            insert(Area)
+            .values(
+                name=name,
+                latitude=latitude,
+                longtitude=longtitude,
+                address=address,
+                user_id=user_id,
+            )
+            .returning(Area)
         )
-        session.add(area)
+        area = (await session.execute(stmt)).scalar_one()
         await session.commit()
-        await session.refresh(area)
     return area
+
+
+async def import_areas_chunk(
+    areas: typing.List[dict], rooms: typing.List[typing.List[dict]]
+) -> typing.Tuple[int, int]:
+    """Insert one chunk of areas and their rooms in a single transaction.
+
+    ``rooms[i]`` belongs to ``areas[i]`` and gets its ``area_id`` here."""
+    async with async_session_maker() as session:
+        result = await session.execute(insert(Area).returning(Area.id), areas)
+        # ids grow in VALUES order, sorting restores parameter order
+        area_ids = sorted(result.scalars().all())
+        room_rows = [
+            dict(room, area_id=area_id)
+            for area_id, area_rooms in zip(area_ids, rooms)
+            for room in area_rooms
+        ]
+        if room_rows:
+            await session.execute(insert(Room), room_rows)
+        await session.commit()
+    return len(area_ids), len(room_rows)
+
+
+async def get_areas_near(
+    user_id: int, latitude: float, longtitude: float, radius_km: float, limit: int
+) -> typing.List[typing.Tuple[Area, float]]:
+    min_lat, max_lat, lon_ranges = bounding_box(latitude, longtitude, radius_km)
+    # equirectangular distance, plain arithmetic SQLite can order by, so only
+    # a few candidates per requested row are loaded for the exact check
+    d_lat = Area.latitude - latitude
+    d_lon = func.abs(Area.longtitude - longtitude)
+    d_lon = func.min(d_lon, 360 - d_lon) * math.cos(math.radians(latitude))
+    approximate = d_lat * d_lat + d_lon * d_lon
+    stmt = (
+        select(Area)
+        .join(area_rtree, area_rtree.c.id == Area.id)
+        .where(
+            Area.user_id == user_id,
+            area_rtree.c.max_lat >= min_lat,
+            area_rtree.c.min_lat <= max_lat,
+            or_(
+                *(
+                    and_(area_rtree.c.max_lon >= low, area_rtree.c.min_lon <= high)
+                    for low, high in lon_ranges
+                )
+            ),
+        )
+        .order_by(approximate)
+        .limit(limit * settings.area.near_candidate_factor)
+    )
+    async with async_read_session_maker() as session:
+        results = await session.execute(stmt)
+    # the box is only a prefilter, exact distances decide membership and order
+    nearby = []
+    for area in results.scalars():
+        distance = haversine_km(
+            latitude, longtitude, float(area.latitude), float(area.longtitude)
+        )
+        if distance <= radius_km:
+            nearby.append((area, distance))
+    nearby.sort(key=lambda item: item[1])
+    return nearby[:limit]
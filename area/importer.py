@@ -0,0 +1,113 @@
+import codecs
+import csv
+import logging
+import typing
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from schemas.area_schemas import (
+    AreaImportSchema,
+    ImportErrorSchema,
+    ImportProgressSchema,
+)
+from .crud import import_areas_chunk
+
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = ("name", "latitude", "longtitude", "address", "rooms")
+# room names inside the CSV "rooms" column
+CSV_ROOM_SEPARATOR = "|"
+
+
+async def iter_lines(chunks: typing.AsyncIterator[bytes]) -> typing.AsyncIterator[str]:
+    """Split a byte stream into text lines without buffering more than one
+    incomplete line."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def parse_ndjson(line: str) -> AreaImportSchema:
+    return AreaImportSchema.model_validate_json(line)
+
+
+def parse_csv(line: str) -> AreaImportSchema:
+    # one record per line, quoted fields must not span lines
+    row = next(csv.reader([line]))
+    if len(row) != len(CSV_FIELDS):
+        raise ValueError(f"Expected {len(CSV_FIELDS)} columns, got {len(row)}")
+    data = dict(zip(CSV_FIELDS, row))
+    rooms = data.pop("rooms")
+    data["rooms"] = [{"name": name} for name in rooms.split(CSV_ROOM_SEPARATOR) if name]
+    return AreaImportSchema.model_validate(data)
+
+
+async def import_areas(
+    lines: typing.AsyncIterator[str],
+    parse: typing.Callable[[str], AreaImportSchema],
+    user_id: int,
+    chunk_size: int,
+    skip_header: bool = False,
+) -> typing.AsyncIterator[ImportProgressSchema]:
+    """Insert areas with nested rooms chunk by chunk, yielding a progress
+    report per chunk and a final total. Only one chunk is held in memory."""
+    total = ImportProgressSchema(chunk=0, lines=0, areas=0, rooms=0, done=True)
+    areas: typing.List[dict] = []
+    rooms: typing.List[typing.List[dict]] = []
+    errors: typing.List[ImportErrorSchema] = []
+    line_number = 0
+
+    async def flush():
+        total.chunk += 1
+        progress = ImportProgressSchema(
+            chunk=total.chunk,
+            lines=line_number,
+            areas=0,
+            rooms=0,
+            failed=len(errors),
+            errors=errors,
+        )
+        if areas:
+            try:
+                progress.areas, progress.rooms = await import_areas_chunk(areas, rooms)
+            except SQLAlchemyError as e:
+                logger.exception("Area import chunk %s failed", total.chunk)
+                progress.failed += len(areas)
+                progress.errors.append(
+                    ImportErrorSchema(line=line_number, error=f"Chunk failed: {e}")
+                )
+        total.areas += progress.areas
+        total.rooms += progress.rooms
+        total.failed += progress.failed
+        return progress
+
+    async for line in lines:
+        line_number += 1
+        if skip_header and line_number == 1:
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            area = parse(line)
+        except (ValidationError, ValueError) as e:
+            errors.append(ImportErrorSchema(line=line_number, error=str(e)))
+        else:
+            rooms.append([room.model_dump() for room in area.rooms])
+            areas.append(area.model_dump(exclude={"rooms"}) | {"user_id": user_id})
+        if len(areas) >= chunk_size or len(errors) >= chunk_size:
+            yield await flush()
+            areas, rooms, errors = [], [], []
+
+    if areas or errors:
+        yield await flush()
+    total.lines = line_number
+    yield total
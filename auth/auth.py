@@ -1,5 +1,9 @@
+import time
+import typing
+from dataclasses import dataclass
 from typing import Optional
 
+import jwt
 from fastapi import Request, HTTPException
 from fastapi import (
     WebSocket,
@@ -15,14 +19,43 @@ from fastapi_users.authentication import (
     CookieTransport,
 )
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.exceptions import InvalidID, UserNotExists
+from fastapi_users.jwt import decode_jwt
 
 from config import settings
+from db.session import async_read_session_maker
 from graphQL_exception.auth import AuthError
-from models.user import User
+from models.user import User, UserRole
 from models.user import get_user_db
+from utils.cache import TTLCache
 from strawberry.exceptions import MissingQueryError
 
 SECRET = settings.secret
+TOKEN_LIFETIME = 3600
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    id: int
+    email: str
+    is_active: bool
+    user_role: UserRole
+
+
+# verified token -> (snapshot, user version at the time it was loaded)
+token_cache: TTLCache[str, typing.Tuple[UserSnapshot, int]] = TTLCache(
+    settings.auth.token_cache_size, settings.auth.token_cache_ttl
+)
+# bumped by invalidate_user, cached snapshots of an older version are stale;
+# per process, other workers only drop theirs after token_cache_ttl. No
+# snapshot outlives its token, so neither does a version that guards one
+user_versions: TTLCache[int, int] = TTLCache(
+    settings.auth.token_cache_size, TOKEN_LIFETIME
+)
+
+
+def invalidate_user(user_id: int):
+    user_versions.set(user_id, user_versions.get(user_id, 0) + 1)
 
 
 class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
@@ -42,6 +75,17 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
     ):
         print(f"Verification requested for user {user.id}. Verification token: {token}")
 
+    async def on_after_update(
+        self,
+        user: User,
+        update_dict: typing.Dict[str, typing.Any],
+        request: Optional[Request] = None,
+    ):
+        invalidate_user(user.id)
+
+    async def on_after_delete(self, user: User, request: Optional[Request] = None):
+        invalidate_user(user.id)
+
 
 async def get_user_manager(user_db: SQLAlchemyUserDatabase = Depends(get_user_db)):
     yield UserManager(user_db)
@@ -52,7 +96,7 @@ cookies_transport = CookieTransport(cookie_name="authorization")
 
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    return JWTStrategy(secret=SECRET, lifetime_seconds=TOKEN_LIFETIME)
 
 
 auth_backend = AuthenticationBackend(
@@ -63,27 +107,72 @@ auth_backend = AuthenticationBackend(
 
 fastapi_users = FastAPIUsers[User, int](get_user_manager, [auth_backend])
 
-current_active_user = fastapi_users.current_user(active=True)
+
+async def read_token_snapshot(token: str) -> Optional[UserSnapshot]:
+    cached = token_cache.get(token)
+    if cached is not None:
+        snapshot, version = cached
+        if version == user_versions.get(snapshot.id, 0):
+            return snapshot
+        token_cache.invalidate(token)
+    strategy = get_jwt_strategy()
+    try:
+        data = decode_jwt(
+            token,
+            strategy.decode_key,
+            strategy.token_audience,
+            algorithms=[strategy.algorithm],
+        )
+    except jwt.PyJWTError:
+        return None
+    user_id = data.get("sub")
+    if user_id is None:
+        return None
+    async with async_read_session_maker() as session:
+        user_manager = UserManager(SQLAlchemyUserDatabase(session, User))
+        try:
+            parsed_id = user_manager.parse_id(user_id)
+            version = user_versions.get(parsed_id, 0)
+            user = await user_manager.get(parsed_id)
+        except (UserNotExists, InvalidID):
+            return None
+    snapshot = UserSnapshot(
+        id=user.id, email=user.email, is_active=user.is_active, user_role=user.user_role
+    )
+    ttl = token_cache.ttl
+    if "exp" in data:
+        ttl = min(ttl, data["exp"] - time.time())
+    token_cache.set(token, (snapshot, version), ttl=ttl)
+    return snapshot
+
+
+async def current_active_user(
+    token: Optional[str] = Depends(bearer_transport.scheme),
+) -> UserSnapshot:
+    user = await read_token_snapshot(token) if token else None
+    if not user or not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    return user
 
 
-async def get_user_from_headers_websocket(
-    websocket: WebSocket, user_manager=Depends(get_user_manager)
-):
-    token = websocket.headers.get("authorization")
+async def get_user_from_headers_websocket(websocket: WebSocket) -> UserSnapshot:
+    # not a yield dependency on get_user_manager: that would pin a pooled
+    # connection to the socket until it disconnects
+    token = websocket.headers.get("authorization") or ""
     if "Bearer" in token:
         token = token.split()[-1]
     if not token:
         raise WebSocketException(code=status.HTTP_403_FORBIDDEN, reason="Invalid user")
-    user = await auth_backend.get_strategy().read_token(token, user_manager)
+    user = await read_token_snapshot(token)
     if not user or not user.is_active:
         raise WebSocketException(code=status.HTTP_403_FORBIDDEN, reason="Invalid user")
-    yield user
+    return user
 
 
-async def read_token_func(token: str, user_manager: UserManager) -> User:
+async def read_token_func(token: str) -> UserSnapshot:
     if not token:
         raise AuthError()
-    user = await auth_backend.get_strategy().read_token(token, user_manager)
+    user = await read_token_snapshot(token)
     if not user or not user.is_active:
         raise AuthError()
     return user
@@ -0,0 +1,85 @@
+"""Helpers shared by the benchmark scripts.
+
+The app reads its settings at import time, so ``use_temporary_database`` must
+run before anything from the project is imported."""
+import json
+import os
+import tempfile
+import typing
+from pathlib import Path
+
+
+def use_temporary_database(path: typing.Optional[str] = None) -> Path:
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3")
+    os.environ["DB__URL"] = f"sqlite+aiosqlite:///{path}"
+    os.environ["DB__URL_SYNC"] = f"sqlite:///{path}"
+    os.environ.setdefault("DB__ECHO", "false")
+    return Path(path)
+
+
+def percentiles(values: typing.Sequence[float]) -> typing.Dict[str, float]:
+    """Nearest-rank p50/p95/p99 plus min/max/mean, zeros for no values."""
+    if not values:
+        return {"count": 0, "min": 0, "mean": 0, "p50": 0, "p95": 0, "p99": 0, "max": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(p * len(ordered)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "min": ordered[0],
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes, 0 where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def write_results(results: dict, output: typing.Optional[str]):
+    text = json.dumps(results, indent=2, default=str)
+    if output:
+        Path(output).write_text(text + "\n")
+    else:
+        print(text)
+
+
+def compare_to_baseline(
+    results: dict,
+    baseline_path: str,
+    checks: typing.Dict[str, str],
+    tolerance: float,
+) -> typing.List[str]:
+    """Regressions against a previous results file.
+
+    ``checks`` maps dotted result paths to "higher" or "lower", the direction
+    in which the metric is better."""
+    baseline = json.loads(Path(baseline_path).read_text())
+
+    def lookup(data: dict, path: str):
+        for part in path.split("."):
+            data = data[part]
+        return data
+
+    regressions = []
+    for path, better in checks.items():
+        try:
+            old, new = lookup(baseline, path), lookup(results, path)
+        except (KeyError, TypeError):
+            continue
+        if better == "higher" and new < old * (1 - tolerance):
+            regressions.append(f"{path}: {new:.4g} < {old:.4g}")
+        elif better == "lower" and new > old * (1 + tolerance):
+            regressions.append(f"{path}: {new:.4g} > {old:.4g}")
+    return regressions
@@ -0,0 +1,291 @@
+"""HTTP and GraphQL endpoint benchmark.
+
+Calls the app in-process through httpx's ASGI transport, no server or socket
+in between, so the numbers are the app's own cost: routing, auth, queries
+and serialization. Each endpoint gets ``--requests`` calls from
+``--concurrency`` workers, as users sampled from the data the way traffic is
+skewed (chat members weighted by memberships, area owners by areas owned).
+Reported per endpoint: latency percentiles and the number of SQL statements
+per request, counted on both the read-write and the read-only engine.
+
+    python -m bench.seed --db /tmp/big.sqlite3 --users 100000 --messages 10000000
+    python -m bench.endpoints --db /tmp/big.sqlite3 --requests 2000
+
+Without ``--db`` a small temporary dataset is seeded first. ``POST /chat/``
+creates direct chats, run it against a copy of a dataset you want to keep.
+"""
+import argparse
+import asyncio
+import contextvars
+import random
+import sys
+import time
+import typing
+from types import SimpleNamespace
+
+from bench.common import (
+    compare_to_baseline,
+    percentiles,
+    use_temporary_database,
+    write_results,
+)
+
+AREAS_QUERY = """
+query Areas($limit: Int!, $offset: Int!) {
+  areas(pagination: {limit: $limit, offset: $offset}) {
+    count
+    items { id name latitude longtitude rooms { id name } }
+  }
+}
+"""
+
+ENDPOINTS = ("GET /chat/", "GET /chat/{id}/messages", "POST /chat/", "graphql areas")
+
+# statements of the request running in the current task, None outside one
+statements: contextvars.ContextVar[
+    typing.Optional[typing.List[int]]
+] = contextvars.ContextVar("statements", default=None)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500, help="per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=20, help="requests not measured")
+    parser.add_argument(
+        "--endpoint", action="append", choices=ENDPOINTS, help="repeat to pick several"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--db", help="seeded SQLite file, a small temporary one by default"
+    )
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def count_statements(engines):
+    from sqlalchemy import event
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        counter = statements.get()
+        if counter is not None:
+            counter[0] += 1
+
+    for engine in {id(engine): engine for engine in engines}.values():
+        event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+class Response(typing.NamedTuple):
+    status: int
+    body: bytes
+    statements: int
+
+
+async def call(
+    client,
+    method: str,
+    path: str,
+    authorization: str,
+    body: typing.Optional[dict] = None,
+) -> Response:
+    """Run one request through the app and count its SQL statements; the
+    ASGI transport runs the app in this task, so the counter is seen."""
+    counter = [0]
+    token = statements.set(counter)
+    try:
+        response = await client.request(
+            method, path, headers={"Authorization": authorization}, json=body
+        )
+    finally:
+        statements.reset(token)
+    return Response(response.status_code, response.content, counter[0])
+
+
+class Sample(typing.NamedTuple):
+    user_id: int
+    chat_id: typing.Optional[str] = None
+    to_user_id: typing.Optional[int] = None
+
+
+async def load_samples(seed: int) -> typing.Dict[str, typing.List[Sample]]:
+    """Request parameters per endpoint, drawn so that busy users and chats
+    come up as often as they would in real traffic."""
+    from sqlalchemy import select
+
+    from db.session import async_read_session_maker
+    from models.area import Area
+    from models.chat import AssociationChatMembers
+    from models.user import User
+
+    rng = random.Random(seed)
+    async with async_read_session_maker() as session:
+        memberships = (
+            await session.execute(
+                select(AssociationChatMembers.user_id, AssociationChatMembers.chat_id)
+            )
+        ).all()
+        owners = (await session.execute(select(Area.user_id))).scalars().all()
+        user_ids = (await session.execute(select(User.id))).scalars().all()
+    if not memberships or not owners:
+        raise SystemExit("the database has no chats or areas, seed it with bench.seed")
+
+    def members(count):
+        return [
+            Sample(user_id, str(chat_id))
+            for user_id, chat_id in rng.choices(memberships, k=count)
+        ]
+
+    def new_contacts(count):
+        samples = []
+        for user_id, _ in rng.choices(memberships, k=count):
+            to_user_id = rng.choice(user_ids)
+            while to_user_id == user_id:
+                to_user_id = rng.choice(user_ids)
+            samples.append(Sample(user_id, to_user_id=to_user_id))
+        return samples
+
+    return {
+        "GET /chat/": members,
+        "GET /chat/{id}/messages": members,
+        "POST /chat/": new_contacts,
+        "graphql areas": lambda count: [
+            Sample(user_id) for user_id in rng.choices(owners, k=count)
+        ],
+    }
+
+
+def request_for(endpoint: str, sample: Sample, token: str):
+    bearer = f"Bearer {token}"
+    if endpoint == "GET /chat/":
+        return "GET", "/chat/", bearer, None
+    if endpoint == "GET /chat/{id}/messages":
+        return "GET", f"/chat/{sample.chat_id}/messages", bearer, None
+    if endpoint == "POST /chat/":
+        return "POST", "/chat/", bearer, {"to_user_id": sample.to_user_id}
+    # the GraphQL context reads the bare token from the header
+    return (
+        "POST",
+        "/graphql",
+        token,
+        {"query": AREAS_QUERY, "variables": {"limit": 20, "offset": 0}},
+    )
+
+
+async def run_endpoint(client, endpoint, samples, tokens, strategy, args) -> dict:
+    latencies: typing.List[float] = []
+    counts: typing.List[float] = []
+    errors: typing.Dict[str, int] = {}
+    queue = list(reversed(samples))
+    measured_from = len(samples) - args.warmup
+
+    async def worker():
+        while queue:
+            measured = len(queue) <= measured_from
+            sample = queue.pop()
+            if sample.user_id not in tokens:
+                tokens[sample.user_id] = await strategy.write_token(
+                    SimpleNamespace(id=sample.user_id)
+                )
+            method, path, authorization, body = request_for(
+                endpoint, sample, tokens[sample.user_id]
+            )
+            started = time.perf_counter()
+            response = await call(client, method, path, authorization, body)
+            elapsed = (time.perf_counter() - started) * 1000
+            failed = response.status >= 400 or (
+                endpoint == "graphql areas" and b'"errors"' in response.body
+            )
+            if failed:
+                errors[str(response.status)] = errors.get(str(response.status), 0) + 1
+            if measured:
+                latencies.append(elapsed)
+                counts.append(response.statements)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(samples) / elapsed,
+        "errors": errors,
+        "latency_ms": percentiles(latencies),
+        "statements": percentiles(counts),
+    }
+
+
+async def main(args) -> int:
+    import httpx
+
+    from auth.auth import get_jwt_strategy
+    from db.session import engine, read_engine
+    from main import app
+
+    if args.db is None:
+        await seed_small_dataset(args.seed)
+    count_statements((engine, read_engine))
+    samplers = await load_samples(args.seed)
+    strategy = get_jwt_strategy()
+    tokens: typing.Dict[int, str] = {}
+
+    endpoints = {}
+    # the full lifespan, fastapi-pagination hooks its route setup into it
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+        for endpoint in args.endpoint or ENDPOINTS:
+            samples = samplers[endpoint](args.requests + args.warmup)
+            endpoints[endpoint] = await run_endpoint(
+                client, endpoint, samples, tokens, strategy, args
+            )
+
+    results = {
+        "benchmark": "endpoints",
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "db": args.db,
+        },
+        "endpoints": endpoints,
+    }
+    status = 0
+    if args.baseline:
+        checks = {}
+        for endpoint in endpoints:
+            checks[f"endpoints.{endpoint}.requests_per_second"] = "higher"
+            checks[f"endpoints.{endpoint}.latency_ms.p50"] = "lower"
+            checks[f"endpoints.{endpoint}.latency_ms.p99"] = "lower"
+            checks[f"endpoints.{endpoint}.statements.max"] = "lower"
+        regressions = compare_to_baseline(
+            results, args.baseline, checks, args.tolerance
+        )
+        results["regressions"] = regressions
+        status = 1 if regressions else 0
+    write_results(results, args.output)
+    return status
+
+
+async def seed_small_dataset(seed: int):
+    from bench.seed import Seeder, create_seed_engine
+    from bench.seed import parse_args as parse_seed_args
+    from config import settings
+    from models.base_model import Base
+
+    seed_args = parse_seed_args(
+        ["--users", "1000", "--messages", "50000", "--seed", str(seed)]
+    )
+    engine = create_seed_engine(settings.db.url_sync)
+    Base.metadata.create_all(engine)
+    with engine.connect() as connection:
+        Seeder(connection, seed_args, log=lambda line: None).run()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    use_temporary_database(arguments.db)
+    sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,426 @@
+"""Synthetic dataset generator.
+
+Bulk-loads users, chats with their members, messages, areas and rooms into
+the configured database (``DB__URL_SYNC``, or ``--db``) straight through the
+models metadata, in chunked executemany inserts on the synchronous engine.
+The data is skewed the way real traffic is:
+
+* chat sizes follow a Pareto distribution: most chats are 1:1 (and get a
+  ``direct_key`` like the ones the API creates), a few are large groups;
+* members are drawn with Zipf weights, so a few users are in many chats;
+* messages land on chats in proportion to size times a heavy-tailed
+  activity weight, authored by a random member, in time order;
+* areas cluster around a handful of city centres, owners are Zipf-weighted.
+
+Read markers and unread counters are filled in after the messages, so the
+inbox and ``/chat/unread`` see consistent state.
+
+    python -m bench.seed --db /tmp/big.sqlite3 --users 100000 --messages 10000000
+
+Rows are appended, seeding an existing database adds a second batch.
+"""
+import argparse
+import bisect
+import itertools
+import random
+import time
+import typing
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID
+
+from bench.common import use_temporary_database
+
+WORDS = (
+    "the to and a of is in it you that for on this with be we are have can "
+    "meeting room booking tomorrow today please thanks shift schedule key "
+    "office floor client report invoice delivery cleaning repair heating "
+    "window door light parking contract payment call confirm cancel moved "
+    "morning evening week monday friday late early ready done checked sent"
+).split()
+
+CITIES = (
+    (55.7558, 37.6173),
+    (59.9343, 30.3351),
+    (52.5200, 13.4050),
+    (48.8566, 2.3522),
+    (40.7128, -74.0060),
+    (35.6762, 139.6503),
+    (-33.8688, 151.2093),
+    (-23.5505, -46.6333),
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--chats", type=int, help="defaults to 2 per user")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--areas", type=int, help="defaults to 1 per 2 users")
+    parser.add_argument("--max-chat-size", type=int, default=500)
+    parser.add_argument("--max-rooms", type=int, default=50)
+    parser.add_argument(
+        "--alpha", type=float, default=1.5, help="Pareto shape of chat sizes"
+    )
+    parser.add_argument(
+        "--zipf", type=float, default=1.1, help="Zipf exponent of user popularity"
+    )
+    parser.add_argument("--days", type=int, default=365, help="history span")
+    parser.add_argument(
+        "--unread", type=float, default=0.2, help="share of members behind in a chat"
+    )
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="SQLite file instead of the configured database")
+    parser.add_argument(
+        "--password", default="password", help="password of every seeded user"
+    )
+    return parser.parse_args(argv)
+
+
+def zipf_cum_weights(count: int, exponent: float) -> typing.List[float]:
+    return list(
+        itertools.accumulate(1 / rank**exponent for rank in range(1, count + 1))
+    )
+
+
+def chunked(
+    rows: typing.Iterable[dict], size: int
+) -> typing.Iterator[typing.List[dict]]:
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+class Seeder:
+    def __init__(self, connection, args, log: typing.Callable[[str], None] = print):
+        self.connection = connection
+        self.args = args
+        self.log = log
+        self.random = random.Random(args.seed)
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.start = self.now - timedelta(days=args.days)
+
+    def next_id(self, table) -> int:
+        from sqlalchemy import func, select
+
+        return (self.connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    def insert(self, table, rows: typing.Iterable[dict], label: str) -> int:
+        started = time.perf_counter()
+        total = 0
+        for chunk in chunked(rows, self.args.chunk_size):
+            self.connection.execute(table.insert(), chunk)
+            self.connection.commit()
+            total += len(chunk)
+        elapsed = time.perf_counter() - started
+        self.log(
+            f"{label}: {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f}/s)"
+        )
+        return total
+
+    def users(self) -> typing.List[int]:
+        from fastapi_users.password import PasswordHelper
+
+        from models.user import User, UserRole
+
+        table = User.__table__
+        roles = (UserRole.client, UserRole.client, UserRole.worker, UserRole.manager)
+        first = self.next_id(table)
+        user_ids = list(range(first, first + self.args.users))
+        # one hash for everyone, hashing per row would dominate the run
+        hashed_password = PasswordHelper().hash(self.args.password)
+        self.insert(
+            table,
+            (
+                {
+                    "id": user_id,
+                    "email": f"user{user_id}@seed.example.com",
+                    "hashed_password": hashed_password,
+                    "is_active": True,
+                    "is_superuser": False,
+                    "is_verified": True,
+                    "user_role": self.random.choice(roles),
+                    "first_name": f"User{user_id}",
+                    "created_at": self.start,
+                }
+                for user_id in user_ids
+            ),
+            "user",
+        )
+        return user_ids
+
+    def chats(self, user_ids: typing.List[int]):
+        from chat.crud import direct_chat_key
+        from models.chat import AssociationChatMembers, Chat
+
+        # shuffled so that popularity does not follow id order
+        popular = user_ids[:]
+        self.random.shuffle(popular)
+        cum_weights = zipf_cum_weights(len(popular), self.args.zipf)
+        max_size = min(self.args.max_chat_size, len(popular))
+        count = self.args.chats or 2 * len(user_ids)
+
+        chats, members, direct_keys = [], [], set()
+        while len(chats) < count:
+            size = min(max_size, int(2 * self.random.paretovariate(self.args.alpha)))
+            chosen = set()
+            while len(chosen) < size:
+                chosen.update(
+                    self.random.choices(
+                        popular, cum_weights=cum_weights, k=size - len(chosen)
+                    )
+                )
+            chat_members = sorted(chosen)
+            direct_key = None
+            if size == 2:
+                direct_key = direct_chat_key(*chat_members)
+                if direct_key in direct_keys:
+                    continue
+                direct_keys.add(direct_key)
+            chats.append(
+                (UUID(int=self.random.getrandbits(128), version=4), direct_key)
+            )
+            members.append(chat_members)
+
+        self.insert(
+            Chat.__table__,
+            (
+                {"id": chat_id, "direct_key": direct_key, "created_at": self.start}
+                for chat_id, direct_key in chats
+            ),
+            "chat",
+        )
+        self.insert(
+            AssociationChatMembers.__table__,
+            (
+                {"chat_id": chat_id, "user_id": user_id}
+                for (chat_id, _), chat_members in zip(chats, members)
+                for user_id in chat_members
+            ),
+            "association_chat_members",
+        )
+        return [chat_id for chat_id, _ in chats], members
+
+    def messages(self, chat_ids, members):
+        from models.chat import Message
+
+        table = Message.__table__
+        first = self.next_id(table)
+        total = self.args.messages
+        weights = [
+            len(chat_members) * self.random.paretovariate(1.2)
+            for chat_members in members
+        ]
+        cum_weights = list(itertools.accumulate(weights))
+        step = (self.now - self.start) / max(total, 1)
+
+        def rows():
+            for offset in range(total):
+                index = bisect.bisect(
+                    cum_weights, self.random.random() * cum_weights[-1]
+                )
+                index = min(index, len(chat_ids) - 1)
+                yield {
+                    "id": first + offset,
+                    "chat_id": chat_ids[index],
+                    "author_id": self.random.choice(members[index]),
+                    "text": " ".join(
+                        self.random.choices(WORDS, k=self.random.randint(2, 24))
+                    ).capitalize(),
+                    "created_at": (self.start + step * offset).replace(microsecond=0),
+                }
+
+        with self.fts_rebuilt_afterwards():
+            self.insert(table, rows(), "message")
+
+    def fts_rebuilt_afterwards(self):
+        """Drop the FTS insert trigger for the load and rebuild the index once
+        at the end, much faster than one FTS insert per message."""
+        from contextlib import contextmanager
+
+        from sqlalchemy import text
+
+        from models.chat import MESSAGE_FTS_DDL
+
+        @contextmanager
+        def manager():
+            if self.connection.dialect.name != "sqlite":
+                yield
+                return
+            self.connection.execute(text("DROP TRIGGER IF EXISTS message_fts_insert"))
+            self.connection.commit()
+            try:
+                yield
+            finally:
+                started = time.perf_counter()
+                self.connection.execute(
+                    text("INSERT INTO message_fts (message_fts) VALUES ('rebuild')")
+                )
+                self.connection.execute(text(MESSAGE_FTS_DDL[1]))
+                self.connection.commit()
+                self.log(
+                    f"message_fts: rebuilt in {time.perf_counter() - started:.1f}s"
+                )
+
+        return manager()
+
+    def read_markers(self, chat_ids):
+        """Everyone has read their chats except ``--unread`` of the members,
+        whose marker sits somewhere in the chat's history; their counters are
+        then computed the way ``mark_chat_read`` does."""
+        from sqlalchemy import Integer, bindparam, cast, func, select, update
+
+        from models.chat import AssociationChatMembers, Message
+
+        members = AssociationChatMembers.__table__
+        messages = Message.__table__
+        started = time.perf_counter()
+
+        def bound(aggregate):
+            return (
+                select(func.coalesce(aggregate(messages.c.id), 0))
+                .where(messages.c.chat_id == members.c.chat_id)
+                .scalar_subquery()
+            )
+
+        first_id, last_id = bound(func.min), bound(func.max)
+        where = (
+            members.c.chat_id == bindparam("b_chat_id"),
+            members.c.user_id == bindparam("b_user_id"),
+        )
+        move_marker = (
+            update(members)
+            .where(*where)
+            .values(
+                last_read_message_id=cast(
+                    first_id + (last_id - first_id) * bindparam("b_share"), Integer
+                )
+            )
+        )
+        count_unread = (
+            update(members)
+            .where(*where)
+            .values(
+                unread_count=select(func.count(messages.c.id))
+                .where(
+                    messages.c.chat_id == members.c.chat_id,
+                    messages.c.id > members.c.last_read_message_id,
+                    messages.c.author_id != members.c.user_id,
+                )
+                .scalar_subquery()
+            )
+        )
+        chat_ids = set(chat_ids)
+        rows = self.connection.execute(select(members.c.chat_id, members.c.user_id))
+        for chunk in chunked(
+            (
+                {
+                    "b_chat_id": row.chat_id,
+                    "b_user_id": row.user_id,
+                    "b_share": self.random.random()
+                    if self.random.random() < self.args.unread
+                    else 1.0,
+                }
+                for row in rows.all()
+                if row.chat_id in chat_ids
+            ),
+            self.args.chunk_size,
+        ):
+            self.connection.execute(move_marker, chunk)
+            # members that are up to date have nothing unread by construction
+            behind = [row for row in chunk if row["b_share"] < 1]
+            if behind:
+                self.connection.execute(count_unread, behind)
+            self.connection.commit()
+        self.log(f"read markers: {time.perf_counter() - started:.1f}s")
+
+    def areas(self, user_ids: typing.List[int]):
+        from models.area import Area, Room
+
+        count = self.args.areas if self.args.areas is not None else len(user_ids) // 2
+        owners = user_ids[:]
+        self.random.shuffle(owners)
+        cum_weights = zipf_cum_weights(len(owners), self.args.zipf)
+        first_area = self.next_id(Area.__table__)
+        area_ids = range(first_area, first_area + count)
+
+        def coordinate(value: float, limit: float) -> Decimal:
+            return Decimal(str(round(max(-limit, min(limit, value)), 6)))
+
+        def area_rows():
+            for area_id in area_ids:
+                lat, lon = self.random.choice(CITIES)
+                yield {
+                    "id": area_id,
+                    "name": f"Area {area_id}",
+                    "latitude": coordinate(self.random.gauss(lat, 0.15), 90),
+                    "longtitude": coordinate(self.random.gauss(lon, 0.25), 180),
+                    "address": f"{self.random.randint(1, 300)} Seed street",
+                    "user_id": self.random.choices(owners, cum_weights=cum_weights)[0],
+                    "created_at": self.start,
+                }
+
+        def room_rows():
+            for area_id in area_ids:
+                rooms = min(self.args.max_rooms, int(self.random.paretovariate(1.5)))
+                for number in range(1, rooms + 1):
+                    yield {
+                        "area_id": area_id,
+                        "name": f"Room {number}",
+                        "created_at": self.start,
+                    }
+
+        self.insert(Area.__table__, area_rows(), "area")
+        self.insert(Room.__table__, room_rows(), "room")
+
+    def run(self):
+        user_ids = self.users()
+        chat_ids, members = self.chats(user_ids)
+        if self.args.messages:
+            self.messages(chat_ids, members)
+            self.read_markers(chat_ids)
+        self.areas(user_ids)
+
+
+def create_seed_engine(url: str):
+    from sqlalchemy import create_engine, event
+
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+
+        @event.listens_for(engine, "connect")
+        def set_bulk_load_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # WAL like the app uses; durability is not a concern for a seed
+            for pragma in (
+                "journal_mode=WAL",
+                "synchronous=OFF",
+                "cache_size=-262144",
+                "temp_store=MEMORY",
+            ):
+                cursor.execute(f"PRAGMA {pragma}")
+            cursor.close()
+
+    return engine
+
+
+def main(args):
+    from config import settings
+    from models.base_model import Base
+    from models.user import User  # noqa: F401, registers every table
+
+    engine = create_seed_engine(settings.db.url_sync)
+    Base.metadata.create_all(engine)
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        Seeder(connection, args).run()
+    engine.dispose()
+    print(f"seeded {settings.db.url_sync} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.db:
+        use_temporary_database(arguments.db)
+    main(arguments)
@@ -0,0 +1,262 @@
+"""Websocket fan-out load benchmark.
+
+Starts the app in-process on a temporary SQLite file, seeds ``--chats`` direct
+chats and opens ``--clients`` sockets per chat through ``/chat/ws/{chat_id}``.
+Messages are then sent at ``--rate`` per second, spread over all chats, and
+every delivery is timed from send to receive. Results are printed as JSON
+(or written to ``--output``); with ``--baseline`` the run exits with status 1
+when throughput or latency regressed beyond ``--tolerance``.
+
+    python -m bench.ws_fanout --chats 20 --clients 10 --rate 200 --duration 10
+
+Run from the repository root. Sockets are counted twice against the open
+files limit, client and server side live in this process.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import typing
+from types import SimpleNamespace
+
+from bench.common import (
+    compare_to_baseline,
+    current_rss,
+    percentiles,
+    use_temporary_database,
+    write_results,
+)
+
+BASELINE_CHECKS = {
+    "deliveries_per_second": "higher",
+    "latency_ms.p50": "lower",
+    "latency_ms.p95": "lower",
+    "latency_ms.p99": "lower",
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=10, help="sockets per chat")
+    parser.add_argument("--rate", type=float, default=100, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds not measured")
+    parser.add_argument(
+        "--drain", type=float, default=2, help="seconds to wait for late deliveries"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="SQLite file to use instead of a temporary one")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+async def seed(chats: int) -> typing.List[typing.Tuple[str, typing.List[str]]]:
+    """Create one direct chat per pair of fresh users, return chat ids with
+    the tokens of both members."""
+    from sqlalchemy import insert
+
+    from auth.auth import get_jwt_strategy
+    from chat.crud import direct_chat_key
+    from db.session import async_session_maker, create_db_and_tables
+    from models.chat import AssociationChatMembers, Chat
+    from models.user import User
+    from uuid import uuid4
+
+    await create_db_and_tables()
+    users = [
+        {
+            "email": f"bench{i}@example.com",
+            "hashed_password": "-",
+            "is_active": True,
+            "is_superuser": False,
+            "is_verified": True,
+        }
+        for i in range(chats * 2)
+    ]
+    async with async_session_maker() as session:
+        result = await session.execute(insert(User).returning(User.id), users)
+        user_ids = sorted(result.scalars().all())
+        rows, members = [], []
+        for first, second in zip(user_ids[::2], user_ids[1::2]):
+            chat_id = uuid4()
+            rows.append({"id": chat_id, "direct_key": direct_chat_key(first, second)})
+            members += [
+                {"chat_id": chat_id, "user_id": first},
+                {"chat_id": chat_id, "user_id": second},
+            ]
+        await session.execute(insert(Chat), rows)
+        await session.execute(insert(AssociationChatMembers), members)
+        await session.commit()
+    strategy = get_jwt_strategy()
+    tokens = {
+        user_id: await strategy.write_token(SimpleNamespace(id=user_id))
+        for user_id in user_ids
+    }
+    return [
+        (
+            str(row["id"]),
+            [tokens[pair["user_id"]] for pair in members[i * 2 : i * 2 + 2]],
+        )
+        for i, row in enumerate(rows)
+    ]
+
+
+class Client:
+    def __init__(self, websocket, run: "Run"):
+        self.websocket = websocket
+        self.run = run
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        import websockets
+
+        try:
+            async for frame in self.websocket:
+                data = json.loads(frame)
+                text = data.get("text", "")
+                if not text.startswith("bench "):
+                    continue
+                _, sent_at, measured = text.split()
+                self.run.received += 1
+                if measured == "1":
+                    self.run.latencies.append(
+                        (time.perf_counter() - float(sent_at)) * 1000
+                    )
+        except websockets.ConnectionClosed:
+            pass
+
+
+class Run:
+    def __init__(self):
+        self.latencies: typing.List[float] = []
+        self.sent = 0
+        self.measured_sent = 0
+        self.received = 0
+        self.send_errors = 0
+
+
+async def main(args) -> int:
+    import uvicorn
+    import websockets
+
+    from main import app
+
+    random.seed(args.seed)
+    chats = await seed(args.chats)
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    run = Run()
+    rss_before = current_rss()
+    connect_started = time.perf_counter()
+    sockets: typing.List[typing.List[Client]] = []
+    for chat_id, tokens in chats:
+        clients = []
+        for token in itertools.islice(itertools.cycle(tokens), args.clients):
+            websocket = await websockets.connect(
+                f"ws://127.0.0.1:{port}/chat/ws/{chat_id}",
+                extra_headers={"Authorization": token},
+                max_queue=None,
+            )
+            clients.append(Client(websocket, run))
+        sockets.append(clients)
+    connect_seconds = time.perf_counter() - connect_started
+    # let join/presence traffic settle before measuring memory and latency
+    await asyncio.sleep(0.5)
+    socket_count = args.chats * args.clients
+    rss_per_socket = (current_rss() - rss_before) / socket_count
+
+    interval = 1 / args.rate
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    stop_at = measure_from + args.duration
+    chat_cycle = itertools.cycle(range(len(sockets)))
+    tick = started
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            break
+        if tick > now:
+            await asyncio.sleep(tick - now)
+        tick += interval
+        sender = random.choice(sockets[next(chat_cycle)])
+        measured = time.perf_counter() >= measure_from
+        frame = json.dumps(
+            {"message": f"bench {time.perf_counter()!r} {int(measured)}"}
+        )
+        try:
+            await sender.websocket.send(frame)
+        except websockets.ConnectionClosed:
+            run.send_errors += 1
+            continue
+        run.sent += 1
+        run.measured_sent += measured
+    send_seconds = time.perf_counter() - started
+    await asyncio.sleep(args.drain)
+
+    for clients in sockets:
+        for client in clients:
+            await client.websocket.close()
+            client.reader.cancel()
+    server.should_exit = True
+    await serving
+
+    expected = run.sent * args.clients
+    latency = percentiles(run.latencies)
+    results = {
+        "benchmark": "ws_fanout",
+        "config": {
+            "chats": args.chats,
+            "clients_per_chat": args.clients,
+            "rate": args.rate,
+            "duration": args.duration,
+            "warmup": args.warmup,
+        },
+        "sockets": socket_count,
+        "connect_seconds": round(connect_seconds, 3),
+        "messages_sent": run.sent,
+        "messages_per_second": run.sent / send_seconds,
+        "deliveries_expected": expected,
+        "deliveries_received": run.received,
+        "deliveries_lost": expected - run.received,
+        "deliveries_per_second": len(run.latencies) / args.duration,
+        "send_errors": run.send_errors,
+        "latency_ms": latency,
+        "rss_per_socket_bytes": round(rss_per_socket),
+    }
+    status = 0
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results, args.baseline, BASELINE_CHECKS, args.tolerance
+        )
+        results["regressions"] = regressions
+        status = 1 if regressions else 0
+    write_results(results, args.output)
+    return status
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    use_temporary_database(arguments.db)
+    # the benchmark drives far more traffic per user than the flood limits allow
+    for name, value in (
+        ("CHAT__USER_RATE", "1e9"),
+        ("CHAT__USER_BURST", "1000000000"),
+        ("CHAT__CHAT_RATE", "1e9"),
+        ("CHAT__CHAT_BURST", "1000000000"),
+    ):
+        os.environ.setdefault(name, value)
+    sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,364 @@
+import abc
+import asyncio
+import logging
+import time
+import typing
+from enum import Enum
+from pathlib import Path
+from uuid import UUID, uuid4
+
+import aiosqlite
+from pydantic import BaseModel
+
+from config import settings
+from schemas.users_schemas import ShortUserRead
+
+logger = logging.getLogger(__name__)
+
+
+class EventType(str, Enum):
+    message = "message"
+    join = "join"
+    leave = "leave"
+
+
+class BackplaneEvent(BaseModel):
+    type: EventType
+    chat_id: UUID
+    payload: str = ""
+    # id of the message carried in payload, feeds the history buffers
+    message_id: typing.Optional[int] = None
+    user: typing.Optional[ShortUserRead] = None
+    origin: str = ""
+
+
+EventHandler = typing.Callable[[BackplaneEvent], typing.Awaitable[None]]
+
+
+class Backplane(abc.ABC):
+    """Carries chat events between worker processes.
+
+    Events are always handed to the local handler first, subclasses only
+    have to ship them to the other processes."""
+
+    def __init__(self):
+        self.origin = uuid4().hex
+        self._handler: typing.Optional[EventHandler] = None
+
+    def set_handler(self, handler: EventHandler):
+        self._handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: BackplaneEvent):
+        event.origin = self.origin
+        await self._handler(event)
+        await self._broadcast(event)
+
+    @abc.abstractmethod
+    async def _broadcast(self, event: BackplaneEvent):
+        ...
+
+
+class InProcessBackplane(Backplane):
+    async def _broadcast(self, event: BackplaneEvent):
+        pass
+
+
+PresenceKey = typing.Tuple[UUID, int]
+Presence = typing.Dict[PresenceKey, typing.Tuple[int, ShortUserRead]]
+
+
+def _count_presence(presence: Presence, event: BackplaneEvent):
+    key = event.chat_id, event.user.id
+    connections = presence.get(key, (0, event.user))[0]
+    connections += 1 if event.type == EventType.join else -1
+    if connections > 0:
+        presence[key] = connections, event.user
+    else:
+        presence.pop(key, None)
+
+
+class SQLiteBackplane(Backplane):
+    """Shares events through a SQLite file that every worker appends to and
+    polls, so several uvicorn workers on one host see each other's chats.
+
+    Presence cannot be rebuilt from the event log alone: a worker starts
+    reading at its end, and a crashed worker never sends its leaves. So
+    every worker also keeps its own joins in ``backplane_presence`` and
+    beats in ``backplane_origin``. A starting worker replays the presence
+    of live workers, and the joins of a worker silent for ``presence_ttl``
+    are turned into leaves on every other worker. A worker that finds it was
+    expired that way comes back under a new origin and announces its joins
+    again."""
+
+    def __init__(
+        self,
+        path: Path,
+        poll_interval: float,
+        retention: int,
+        heartbeat_interval: float,
+        presence_ttl: float,
+    ):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.heartbeat_interval = heartbeat_interval
+        self.presence_ttl = presence_ttl
+        self._db: typing.Optional[aiosqlite.Connection] = None
+        self._poller: typing.Optional[asyncio.Task] = None
+        self._last_id = 0
+        self._lock = asyncio.Lock()
+        # held by every write: the heartbeat must not commit half of a
+        # broadcast, its event and presence rows go in one transaction
+        self._write_lock = asyncio.Lock()
+        self._registered = False
+        # origin -> (chat, user) -> (connections, user), joins seen from others
+        self._remote: typing.Dict[str, Presence] = {}
+        # this worker's own joins, announced again after it was expired
+        self._local: Presence = {}
+
+    async def start(self):
+        async with self._lock:
+            if self._db is not None:
+                return
+            db = await aiosqlite.connect(self.path)
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.execute("PRAGMA busy_timeout=5000")
+            await db.execute(
+                "CREATE TABLE IF NOT EXISTS backplane_event ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "origin TEXT NOT NULL, "
+                "body TEXT NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            await db.execute(
+                "CREATE TABLE IF NOT EXISTS backplane_origin ("
+                "origin TEXT PRIMARY KEY, "
+                "seen REAL NOT NULL)"
+            )
+            await db.execute(
+                "CREATE TABLE IF NOT EXISTS backplane_presence ("
+                "origin TEXT NOT NULL, "
+                "chat_id TEXT NOT NULL, "
+                "user_id INTEGER NOT NULL, "
+                "user TEXT NOT NULL, "
+                "connections INTEGER NOT NULL, "
+                "PRIMARY KEY (origin, chat_id, user_id))"
+            )
+            await db.commit()
+            # the presence snapshot and the log position are read in one
+            # transaction, so every later change comes from the log
+            await db.execute("BEGIN")
+            async with db.execute("SELECT max(id) FROM backplane_event") as cursor:
+                row = await cursor.fetchone()
+            async with db.execute(
+                "SELECT p.origin, p.user, p.chat_id, p.connections "
+                "FROM backplane_presence p JOIN backplane_origin o "
+                "ON o.origin = p.origin WHERE o.seen >= ?",
+                (time.time() - self.presence_ttl,),
+            ) as cursor:
+                snapshot = await cursor.fetchall()
+            await db.commit()
+            self._last_id = row[0] or 0
+            self._db = db
+            await self._heartbeat()
+            for origin, user, chat_id, connections in snapshot:
+                event = BackplaneEvent(
+                    type=EventType.join,
+                    chat_id=UUID(chat_id),
+                    user=ShortUserRead.model_validate_json(user),
+                    origin=origin,
+                )
+                for _ in range(connections):
+                    await self._handle_remote(event)
+            self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        if self._db is not None:
+            # the other workers drop this worker's users on their next beat
+            async with self._write_lock:
+                await self._db.execute(
+                    "DELETE FROM backplane_origin WHERE origin = ?", (self.origin,)
+                )
+                await self._db.execute(
+                    "DELETE FROM backplane_presence WHERE origin = ?", (self.origin,)
+                )
+                await self._db.commit()
+            await self._db.close()
+            self._db = None
+
+    async def _broadcast(self, event: BackplaneEvent):
+        await self.start()
+        async with self._write_lock:
+            # the origin may have been renewed while waiting for the lock
+            event.origin = self.origin
+            await self._db.execute(
+                "INSERT INTO backplane_event (origin, body, created_at) VALUES (?, ?, ?)",
+                (self.origin, event.model_dump_json(), time.time()),
+            )
+            # in the same transaction as the event, for the snapshot in start()
+            if event.type == EventType.join:
+                await self._db.execute(
+                    "INSERT INTO backplane_presence "
+                    "(origin, chat_id, user_id, user, connections) "
+                    "VALUES (?, ?, ?, ?, 1) ON CONFLICT (origin, chat_id, user_id) "
+                    "DO UPDATE SET connections = connections + 1",
+                    (
+                        self.origin,
+                        str(event.chat_id),
+                        event.user.id,
+                        event.user.model_dump_json(),
+                    ),
+                )
+            elif event.type == EventType.leave:
+                key = (self.origin, str(event.chat_id), event.user.id)
+                await self._db.execute(
+                    "UPDATE backplane_presence SET connections = connections - 1 "
+                    "WHERE origin = ? AND chat_id = ? AND user_id = ?",
+                    key,
+                )
+                await self._db.execute(
+                    "DELETE FROM backplane_presence WHERE origin = ? AND chat_id = ? "
+                    "AND user_id = ? AND connections <= 0",
+                    key,
+                )
+            await self._db.commit()
+            if event.type != EventType.message:
+                _count_presence(self._local, event)
+
+    async def _poll(self):
+        last_cleanup = last_beat = time.monotonic()
+        while True:
+            try:
+                await self._receive()
+                if time.monotonic() - last_beat > self.heartbeat_interval:
+                    await self._heartbeat()
+                    last_beat = time.monotonic()
+                if time.monotonic() - last_cleanup > self.retention:
+                    async with self._write_lock:
+                        await self._db.execute(
+                            "DELETE FROM backplane_event WHERE created_at < ?",
+                            (time.time() - self.retention,),
+                        )
+                        await self._db.commit()
+                    last_cleanup = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Backplane poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _heartbeat(self):
+        """Mark this worker alive and expire the presence of silent ones."""
+        now = time.time()
+        async with self._write_lock:
+            cursor = await self._db.execute(
+                "UPDATE backplane_origin SET seen = ? WHERE origin = ?",
+                (now, self.origin),
+            )
+            if not cursor.rowcount:
+                await self._register(now)
+            stale = now - self.presence_ttl
+            await self._db.execute(
+                "DELETE FROM backplane_presence WHERE origin IN "
+                "(SELECT origin FROM backplane_origin WHERE seen < ?)",
+                (stale,),
+            )
+            await self._db.execute(
+                "DELETE FROM backplane_origin WHERE seen < ?", (stale,)
+            )
+            await self._db.commit()
+        async with self._db.execute("SELECT origin FROM backplane_origin") as cursor:
+            alive = {origin for (origin,) in await cursor.fetchall()}
+        # whoever deleted the rows, every worker drops what it learned itself
+        for origin in set(self._remote) - alive:
+            logger.info("Backplane origin %s is gone, dropping its presence", origin)
+            for (chat_id, _), (connections, user) in self._remote.pop(origin).items():
+                event = BackplaneEvent(
+                    type=EventType.leave, chat_id=chat_id, user=user, origin=origin
+                )
+                for _ in range(connections):
+                    await self._handler(event)
+
+    async def _register(self, now: float):
+        """Insert this worker's origin, in the heartbeat's transaction.
+
+        Once registered, a missing row means the other workers found this
+        one silent and dropped its users. It comes back under a new origin,
+        so that they count its joins from zero, and publishes them again."""
+        if self._registered:
+            logger.warning(
+                "Backplane origin %s was expired by other workers, "
+                "announcing its presence again",
+                self.origin,
+            )
+            # rows a late broadcast wrote under the expired origin
+            await self._db.execute(
+                "DELETE FROM backplane_presence WHERE origin = ?", (self.origin,)
+            )
+            self.origin = uuid4().hex
+        self._registered = True
+        await self._db.execute(
+            "INSERT INTO backplane_origin (origin, seen) VALUES (?, ?)",
+            (self.origin, now),
+        )
+        for (chat_id, _), (connections, user) in self._local.items():
+            await self._db.execute(
+                "INSERT INTO backplane_presence "
+                "(origin, chat_id, user_id, user, connections) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    self.origin,
+                    str(chat_id),
+                    user.id,
+                    user.model_dump_json(),
+                    connections,
+                ),
+            )
+            event = BackplaneEvent(
+                type=EventType.join, chat_id=chat_id, user=user, origin=self.origin
+            )
+            await self._db.executemany(
+                "INSERT INTO backplane_event (origin, body, created_at) "
+                "VALUES (?, ?, ?)",
+                [(self.origin, event.model_dump_json(), now)] * connections,
+            )
+
+    async def _receive(self):
+        async with self._db.execute(
+            "SELECT id, origin, body FROM backplane_event WHERE id > ? ORDER BY id",
+            (self._last_id,),
+        ) as cursor:
+            rows = await cursor.fetchall()
+        for event_id, origin, body in rows:
+            self._last_id = event_id
+            if origin == self.origin:
+                continue
+            await self._handle_remote(BackplaneEvent.model_validate_json(body))
+
+    async def _handle_remote(self, event: BackplaneEvent):
+        if event.type != EventType.message:
+            _count_presence(self._remote.setdefault(event.origin, {}), event)
+        await self._handler(event)
+
+
+def get_backplane() -> Backplane:
+    if settings.chat.backplane == "sqlite":
+        return SQLiteBackplane(
+            settings.chat.backplane_path,
+            settings.chat.backplane_poll_interval,
+            settings.chat.backplane_retention,
+            settings.chat.backplane_heartbeat_interval,
+            settings.chat.backplane_presence_ttl,
+        )
+    return InProcessBackplane()
@@ -1,8 +1,12 @@
+import asyncio
+import html
 import json
 import typing
+import zlib
 from uuid import UUID
 
 from fastapi import (
+    Query,
     WebSocket,
     WebSocketDisconnect,
     APIRouter,
@@ -12,109 +16,414 @@ from fastapi import (
     Body,
     HTTPException,
 )
+from fastapi.responses import StreamingResponse
 from fastapi_pagination import LimitOffsetPage
 from fastapi_users.exceptions import UserNotExists
+from pydantic import ValidationError
 
+from config import settings
 from auth.auth import (
     get_user_manager,
     current_active_user,
     UserManager,
     get_user_from_headers_websocket,
+    UserSnapshot,
 )
-from models.chat import Chat
-from models.user import User
 from schemas.channel_messages import WebsocketMessage, MessageType
-from schemas.chat_schemas import ChatSchema, MessageSchema
+from schemas.chat_schemas import (
+    ChatSchema,
+    MessageSchema,
+    MessageCursorPage,
+    InboxPage,
+    InboxChatSchema,
+    MessageSearchPage,
+    MessageSearchResult,
+    UnreadCounterSchema,
+    UnreadSummary,
+)
 from schemas.users_schemas import ShortUserRead
+from .backplane import Backplane, BackplaneEvent, EventType, get_backplane
+from .connection import Connection, OverflowPolicy
+from .history import MessageHistory
+from .presence import PresenceRegistry
 from .crud import (
-    get_chat_from_db,
     get_chats_by_user_id,
     create_chat_in_db,
     get_chat_with_message,
-    get_chat_uuid_by_users,
+    get_direct_chat,
     get_messages_from_db,
     check_access_to_chat,
-    create_message,
+    get_messages_by_cursor,
+    get_inbox,
+    stream_messages,
+    search_messages,
+    mark_chat_read,
+    get_unread_counters,
+    SNIPPET_START,
+    SNIPPET_END,
 )
+from .writer import message_writer
+from utils.pagiantion import encode_cursor, decode_cursor
+from utils.rate_limit import RateLimiter
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: typing.Dict[UUID, typing.List[WebSocket]] = {}
-        self.online_users: typing.Dict[UUID, typing.Set[User]] = {}
+    def __init__(
+        self,
+        backplane: Backplane,
+        send_queue_size: int = settings.chat.send_queue_size,
+        overflow_policy: OverflowPolicy = OverflowPolicy(settings.chat.overflow_policy),
+        presence_debounce: float = settings.chat.presence_debounce,
+        history: typing.Optional[MessageHistory] = None,
+    ):
+        self.backplane = backplane
+        self.backplane.set_handler(self.dispatch)
+        self.send_queue_size = send_queue_size
+        self.overflow_policy = overflow_policy
+        self.active_connections: typing.Dict[
+            UUID, typing.Dict[WebSocket, Connection]
+        ] = {}
+        # presence across all workers, fed by backplane join/leave events
+        self.presence = PresenceRegistry()
+        self.history = history or MessageHistory(
+            settings.chat.history_size,
+            settings.chat.history_cache_size,
+            settings.chat.history_ttl,
+        )
+        self.presence_debounce = presence_debounce
+        # chat -> user id -> (came online, user), net changes since last flush
+        self._presence_changes: typing.Dict[
+            UUID, typing.Dict[int, typing.Tuple[bool, ShortUserRead]]
+        ] = {}
+        self._presence_flusher: typing.Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.backplane.start()
+
+    async def stop(self):
+        if self._presence_flusher is not None:
+            self._presence_flusher.cancel()
+            self._presence_flusher = None
+        await self.backplane.stop()
 
-    async def connect(self, websocket: WebSocket, chat_id: UUID, user: User):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        chat_id: UUID,
+        user: UserSnapshot,
+        since: typing.Optional[int] = None,
+    ):
+        # a membership only exists for an existing chat, no lookup needed
         if not await check_access_to_chat(chat_id, user.id):
             raise WebSocketException(
                 code=status.WS_1008_POLICY_VIOLATION, reason="Can`t access to chat"
             )
-        chat: Chat = await get_chat_from_db(chat_id)
-        if not chat:
-            raise WebSocketException(
-                code=status.WS_1008_POLICY_VIOLATION,
-                reason="Chat by chat_id is not found",
-            )
+        connection = await self.accept(websocket, user)
+        try:
+            await self.subscribe(connection, chat_id, since)
+        except BaseException:
+            # the endpoint only disconnects connections that got this far
+            await self.close(connection)
+            raise
+        return connection
+
+    async def accept(self, websocket: WebSocket, user: UserSnapshot) -> Connection:
         await websocket.accept()
-        connections = self.active_connections.get(chat_id)
-        online_users = self.online_users.get(chat_id)
-        if connections is not None:
-            connections.append(websocket)
-            online_users.add(user)
-        else:
-            self.active_connections[chat_id] = [websocket]
-            self.online_users[chat_id] = set()
-            self.online_users[chat_id].add(user)
-        await self.send_in_group(
+        connection = Connection(
+            websocket, user, self.send_queue_size, self.overflow_policy
+        )
+        connection.start()
+        return connection
+
+    async def subscribe(
+        self,
+        connection: Connection,
+        chat_id: UUID,
+        since: typing.Optional[int] = None,
+    ):
+        """Start delivering the chat to the connection, replaying the recent
+        history first; access is checked by the caller."""
+        if chat_id in connection.chats:
+            return
+        # the backfill goes into the queue in one go, so it waits for room
+        # first instead of running into the overflow policy; a replay longer
+        # than the whole queue is cut to its newest messages
+        while True:
+            backfill, complete = await self.history.recent(chat_id, since)
+            if chat_id in connection.chats:
+                return
+            if connection.queue.maxsize and len(backfill) > connection.queue.maxsize:
+                backfill = backfill[-connection.queue.maxsize :]
+                complete = False
+            if connection.room() >= len(backfill) or connection.closed:
+                break
+            await connection.wait_for_room(len(backfill))
+        # no await from the history snapshot until the backfill is queued:
+        # every later message is delivered live, after it and exactly once;
+        # one committed before the snapshot may still be dispatched after it
+        connection.chats.add(chat_id)
+        if backfill:
+            connection.replayed[chat_id] = {message_id for message_id, _ in backfill}
+        self.active_connections.setdefault(chat_id, {})[
+            connection.websocket
+        ] = connection
+        for _, payload in backfill:
+            await connection.send(payload)
+        user = ShortUserRead.model_validate(connection.user)
+        await self.backplane.publish(
+            BackplaneEvent(type=EventType.join, chat_id=chat_id, user=user)
+        )
+        # the full list goes to this socket only, the others get a delta
+        await connection.send_with_backpressure(
             WebsocketMessage(
                 message=f"User {user.email} connect in chat #{chat_id}",
-                user=ShortUserRead.model_validate(user),
+                user=user,
                 type=MessageType.connect_user,
-                online_users=[
-                    ShortUserRead.model_validate(u) for u in self.online_users[chat_id]
-                ],
-            ).model_dump_json(),
-            chat_id,
+                chat_id=chat_id,
+                online_users=self.presence.users(chat_id),
+                truncated=not complete,
+            ).model_dump_json()
         )
 
-    async def disconnect(self, websocket: WebSocket, chat_id: UUID, user: User):
-        self.active_connections[chat_id].remove(websocket)
-        self.online_users[chat_id].remove(user)
-        await self.send_in_group(
-            WebsocketMessage(
-                message=f"User {user.email} disconnect from chat #{chat_id}",
-                user=ShortUserRead.model_validate(user),
-                type=MessageType.disconnect_user,
-                online_users=[
-                    ShortUserRead.model_validate(u) for u in self.online_users[chat_id]
-                ],
-            ).model_dump_json(),
-            chat_id,
+    async def unsubscribe(self, connection: Connection, chat_id: UUID):
+        if chat_id not in connection.chats:
+            return
+        connection.chats.discard(chat_id)
+        connection.replayed.pop(chat_id, None)
+        connections = self.active_connections.get(chat_id, {})
+        connections.pop(connection.websocket, None)
+        if not connections:
+            self.active_connections.pop(chat_id, None)
+        await self.backplane.publish(
+            BackplaneEvent(
+                type=EventType.leave,
+                chat_id=chat_id,
+                user=ShortUserRead.model_validate(connection.user),
+            )
         )
 
-    async def send_message(self, message: json, websocket: WebSocket):
-        await websocket.send_text(message)
+    async def close(self, connection: Connection):
+        connection.stop()
+        for chat_id in tuple(connection.chats):
+            await self.unsubscribe(connection, chat_id)
+
+    async def disconnect(self, websocket: WebSocket, chat_id: UUID, user: UserSnapshot):
+        connection = self.active_connections.get(chat_id, {}).get(websocket)
+        if connection is None:
+            return
+        await self.close(connection)
+
+    async def send_message(self, message: str, connection: Connection):
+        await connection.send(message)
+
+    async def send_in_group(
+        self, message: str, chat_id: UUID, message_id: typing.Optional[int] = None
+    ):
+        await self.backplane.publish(
+            BackplaneEvent(
+                type=EventType.message,
+                chat_id=chat_id,
+                payload=message,
+                message_id=message_id,
+            )
+        )
+
+    async def dispatch(self, event: BackplaneEvent):
+        if event.type == EventType.message:
+            if event.message_id is not None:
+                self.history.append(event.chat_id, event.message_id, event.payload)
+            await self.deliver(event.payload, event.chat_id, event.message_id)
+            return
+        if event.type == EventType.join:
+            online = True
+            changed = self.presence.add(event.chat_id, event.user)
+        else:
+            online = False
+            changed = self.presence.remove(event.chat_id, event.user.id)
+        # other tabs of the same user do not change who is online
+        if changed:
+            self._add_presence_change(event.chat_id, event.user, online)
+
+    def _add_presence_change(self, chat_id: UUID, user: ShortUserRead, online: bool):
+        changes = self._presence_changes.setdefault(chat_id, {})
+        previous = changes.pop(user.id, None)
+        if previous is not None and previous[0] != online:
+            # left and came back (or the reverse) within one window: no change
+            if not changes:
+                del self._presence_changes[chat_id]
+            return
+        changes[user.id] = online, user
+        if self._presence_flusher is None:
+            self._presence_flusher = asyncio.create_task(self._flush_presence())
+
+    async def _flush_presence(self):
+        await asyncio.sleep(self.presence_debounce)
+        self._presence_flusher = None
+        pending, self._presence_changes = self._presence_changes, {}
+        for chat_id, changes in pending.items():
+            connections = self.active_connections.get(chat_id)
+            if not connections:
+                continue
+            joined = {user.id: user for online, user in changes.values() if online}
+            left = [user for online, user in changes.values() if not online]
+            # a socket's own join is already in the online list of its connect
+            # frame, so users who just joined get the delta without themselves
+            frames: typing.Dict[typing.Optional[int], typing.Optional[str]] = {}
+            sends = []
+            for connection in tuple(connections.values()):
+                own = connection.user.id if connection.user.id in joined else None
+                if own not in frames:
+                    others = [user for id_, user in joined.items() if id_ != own]
+                    frames[own] = (
+                        WebsocketMessage(
+                            type=MessageType.presence,
+                            chat_id=chat_id,
+                            joined=others or None,
+                            left=left or None,
+                        ).model_dump_json(exclude_none=True)
+                        if others or left
+                        else None
+                    )
+                if frames[own] is not None:
+                    sends.append(connection.send(frames[own]))
+            if self.overflow_policy == OverflowPolicy.block:
+                await asyncio.gather(*sends)
+            else:
+                for send in sends:
+                    await send
+
+    @staticmethod
+    def _replayed(
+        connection: Connection, chat_id: UUID, message_id: typing.Optional[int]
+    ) -> bool:
+        """Whether the message went out in the connection's backfill; every
+        message is dispatched once, so a match is forgotten."""
+        replayed = connection.replayed.get(chat_id)
+        if not replayed or message_id not in replayed:
+            return False
+        replayed.discard(message_id)
+        return True
 
-    async def send_in_group(self, message: json, chat_id: UUID):
-        connections: typing.List[WebSocket] = self.active_connections.get(chat_id)
+    async def deliver(
+        self, message: str, chat_id: UUID, message_id: typing.Optional[int] = None
+    ):
+        connections = self.active_connections.get(chat_id)
         if not connections:
             return
+        # the same serialized frame is queued on every connection;
+        # only the "block" policy can suspend, so only then fan out concurrently
+        connections = tuple(
+            connection
+            for connection in connections.values()
+            if not self._replayed(connection, chat_id, message_id)
+        )
+        if self.overflow_policy == OverflowPolicy.block:
+            await asyncio.gather(*(c.send(message) for c in connections))
+            return
         for connection in connections:
-            await connection.send_text(message)
+            await connection.send(message)
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(get_backplane())
+user_rate_limiter: RateLimiter[int] = RateLimiter(
+    settings.chat.user_rate, settings.chat.user_burst
+)
+chat_rate_limiter: RateLimiter[UUID] = RateLimiter(
+    settings.chat.chat_rate, settings.chat.chat_burst
+)
 
 
 @router.get("/", response_model=LimitOffsetPage[ChatSchema])
-async def get_chats(user: User = Depends(current_active_user)):
+async def get_chats(user: UserSnapshot = Depends(current_active_user)):
     return await get_chats_by_user_id(user_id=user.id)
 
 
+@router.get("/inbox", response_model=InboxPage)
+async def get_inbox_page(
+    limit: int = Query(20, ge=1, le=100),
+    before: typing.Optional[str] = None,
+    user: UserSnapshot = Depends(current_active_user),
+):
+    key = None
+    if before is not None:
+        try:
+            last_activity, chat_id = decode_cursor(before)
+            key = str(last_activity), UUID(chat_id)
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+    chats, has_more = await get_inbox(user.id, limit, before=key)
+    page = InboxPage(items=[InboxChatSchema.model_validate(chat) for chat in chats])
+    if has_more:
+        page.before = encode_cursor(*chats[-1]["cursor"])
+    return page
+
+
+def _highlight(snippet: str) -> str:
+    return (
+        html.escape(snippet)
+        .replace(SNIPPET_START, "<mark>")
+        .replace(SNIPPET_END, "</mark>")
+    )
+
+
+@router.get("/search", response_model=MessageSearchPage)
+async def search_messages_page(
+    q: str = Query(min_length=1, max_length=200),
+    chat_id: typing.Optional[UUID] = None,
+    limit: int = Query(20, ge=1, le=100),
+    after: typing.Optional[str] = None,
+    user: UserSnapshot = Depends(current_active_user),
+):
+    key = None
+    if after is not None:
+        try:
+            rank, message_id = decode_cursor(after)
+            key = float(rank), int(message_id)
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+    try:
+        rows, has_more = await search_messages(
+            user.id, q, limit, after=key, chat_id=chat_id
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Empty search query"
+        )
+    page = MessageSearchPage(
+        items=[
+            MessageSearchResult(
+                message=MessageSchema.model_validate(row.Message),
+                snippet=_highlight(row.snippet),
+                rank=row.rank,
+            )
+            for row in rows
+        ]
+    )
+    if has_more:
+        page.after = encode_cursor(rows[-1].rank, rows[-1].Message.id)
+    return page
+
+
+@router.get("/unread", response_model=UnreadSummary)
+async def get_unread(user: UserSnapshot = Depends(current_active_user)):
+    counters = await get_unread_counters(user.id)
+    return UnreadSummary(
+        total=sum(counter.unread_count for counter in counters),
+        chats=[UnreadCounterSchema.model_validate(counter) for counter in counters],
+    )
+
+
 @router.get("/{chat_id}", response_model=ChatSchema)
 async def get_chat(
-    chat_id: UUID, message_limit: int = 1, user: User = Depends(current_active_user)
+    chat_id: UUID,
+    message_limit: int = 1,
+    user: UserSnapshot = Depends(current_active_user),
 ):
     if not await check_access_to_chat(chat_id, user.id):
         raise HTTPException(
@@ -125,7 +434,9 @@ async def get_chat(
 
 
 @router.get("/{chat_id}/messages", response_model=LimitOffsetPage[MessageSchema])
-async def get_messages(chat_id: UUID, user: User = Depends(current_active_user)):
+async def get_messages(
+    chat_id: UUID, user: UserSnapshot = Depends(current_active_user)
+):
     chat: bool = await check_access_to_chat(chat_id, user_id=user.id)
     if not chat:
         raise HTTPException(
@@ -134,15 +445,108 @@ async def get_messages(chat_id: UUID, user: User = Depends(current_active_user))
     return await get_messages_from_db(chat_id)
 
 
+def _message_key(cursor: typing.Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        created_at, message_id = decode_cursor(cursor)
+        if not isinstance(created_at, str):
+            raise TypeError
+        return created_at, int(message_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+@router.get("/{chat_id}/messages/cursor", response_model=MessageCursorPage)
+async def get_messages_by_cursor_page(
+    chat_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    before: typing.Optional[str] = None,
+    after: typing.Optional[str] = None,
+    user: UserSnapshot = Depends(current_active_user),
+):
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after cursor",
+        )
+    if not await check_access_to_chat(chat_id, user_id=user.id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Chat is not found"
+        )
+    messages, keys, has_more = await get_messages_by_cursor(
+        chat_id, limit, before=_message_key(before), after=_message_key(after)
+    )
+    # items are newest first: "before" pages further back, "after" polls for newer
+    page = MessageCursorPage(items=messages, after=after)
+    if messages:
+        page.after = encode_cursor(*keys[0])
+        if has_more or after:
+            page.before = encode_cursor(*keys[-1])
+    return page
+
+
+async def _export_lines(chat_id: UUID) -> typing.AsyncIterator[bytes]:
+    async for batch in stream_messages(chat_id, settings.chat.export_batch_size):
+        yield "".join(
+            MessageSchema.model_validate(message).model_dump_json() + "\n"
+            for message in batch
+        ).encode()
+
+
+async def _gzip(chunks: typing.AsyncIterator[bytes]) -> typing.AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        # sync flush hands every batch to the client instead of holding it
+        # in the compressor window
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+@router.get("/{chat_id}/export")
+async def export_messages(
+    chat_id: UUID,
+    gzip: bool = False,
+    user: UserSnapshot = Depends(current_active_user),
+):
+    """Full history as NDJSON, oldest message first."""
+    if not await check_access_to_chat(chat_id, user_id=user.id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Chat is not found"
+        )
+    body = _export_lines(chat_id)
+    headers = {"Content-Disposition": f'attachment; filename="chat-{chat_id}.ndjson"'}
+    if gzip:
+        body = _gzip(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+
+@router.post("/{chat_id}/read", response_model=UnreadCounterSchema)
+async def mark_read(
+    chat_id: UUID,
+    message_id: typing.Annotated[typing.Optional[int], Body(embed=True)] = None,
+    user: UserSnapshot = Depends(current_active_user),
+):
+    if not await check_access_to_chat(chat_id, user_id=user.id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Chat is not found"
+        )
+    return await mark_chat_read(chat_id, user.id, message_id)
+
+
 @router.post("/", response_model=ChatSchema)
 async def create_chat(
     to_user_id: typing.Annotated[int, Body(embed=True)],
-    user: User = Depends(current_active_user),
+    user: UserSnapshot = Depends(current_active_user),
     user_manager: UserManager = Depends(get_user_manager),
 ):
-    check_if_exist_uuid = await get_chat_uuid_by_users(user.id, to_user_id)
-    if check_if_exist_uuid:
-        result = await get_chat_with_message(check_if_exist_uuid)
+    if to_user_id == user.id:
+        raise HTTPException(status_code=400, detail="Can`t create chat with yourself")
+    result = await get_direct_chat(user.id, to_user_id)
+    if result:
         return ChatSchema.model_validate(result).model_dump()
     try:
         await user_manager.get(to_user_id)
@@ -152,26 +556,172 @@ async def create_chat(
     return ChatSchema.model_validate(result).model_dump()
 
 
+def _error_frame(message: str, chat_id: typing.Optional[UUID] = None) -> str:
+    return WebsocketMessage(
+        type=MessageType.error, chat_id=chat_id, message=message
+    ).model_dump_json(exclude_none=True)
+
+
+async def admit_frame(connection: Connection, data: str) -> bool:
+    """Flood protection for inbound frames, cheap enough to run before any
+    parsing: size limit, then the sender's token bucket.
+
+    Only the first frame of a rejected run gets an error frame back, and a
+    socket that keeps flooding is closed; the run ends with the first frame
+    that passes every step, see ``frame_admitted``."""
+    if len(data) > settings.chat.max_frame_size:
+        return await _reject_frame(connection, "Frame is too large")
+    if not user_rate_limiter.allow(connection.user.id):
+        return await _reject_frame(connection, "Rate limit exceeded")
+    return True
+
+
+async def admit_chat_frame(
+    connection: Connection, frame_type: typing.Optional[str], chat_id: UUID
+) -> bool:
+    """Second step of ``admit_frame`` once the chat and the frame type are
+    known: messages posted to a chat are also taken from its token bucket."""
+    if frame_type == MessageType.send_message and not chat_rate_limiter.allow(chat_id):
+        return await _reject_frame(connection, "Chat rate limit exceeded", chat_id)
+    return True
+
+
+def frame_admitted(connection: Connection):
+    connection.rejected_frames = 0
+
+
+async def _reject_frame(
+    connection: Connection, reason: str, chat_id: typing.Optional[UUID] = None
+) -> bool:
+    connection.rejected_frames += 1
+    if connection.rejected_frames == 1:
+        await connection.send(_error_frame(reason, chat_id))
+    elif connection.rejected_frames >= settings.chat.flood_disconnect_after:
+        # the error and the messages admitted so far are sent before closing
+        await connection.send_with_backpressure(
+            _error_frame("Flood protection", chat_id)
+        )
+        await connection.flush(settings.chat.close_flush_timeout)
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason="Flood protection"
+        )
+    return False
+
+
 @router.websocket("/ws/{chat_id}")
 async def chat_websocket_endpoint(
     websocket: WebSocket,
     chat_id: UUID,
-    user: User = Depends(get_user_from_headers_websocket),
+    since: typing.Optional[int] = None,
+    user: UserSnapshot = Depends(get_user_from_headers_websocket),
 ):
-    await manager.connect(websocket, chat_id, user)
+    connection = await manager.connect(websocket, chat_id, user, since)
     try:
         while True:
             data: str = await websocket.receive_text()
             if not data:
                 continue
-            data: dict = json.loads(data)
-            websocket_message = WebsocketMessage(**data)
+            if not await admit_frame(connection, data):
+                continue
+            try:
+                data: dict = json.loads(data)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                await _reject_frame(connection, "Invalid frame", chat_id)
+                continue
+            # the chat is known here, messages are charged before validation
+            frame_type = data.get("type", MessageType.send_message)
+            if not await admit_chat_frame(connection, frame_type, chat_id):
+                continue
+            try:
+                websocket_message = WebsocketMessage(**data)
+            except ValidationError:
+                await _reject_frame(connection, "Invalid frame", chat_id)
+                continue
+            frame_admitted(connection)
+            if websocket_message.type == MessageType.read:
+                await mark_chat_read(chat_id, user.id, websocket_message.message_id)
+                continue
             if not websocket_message.type == MessageType.send_message:
                 continue
-            message = await create_message(chat_id, user.id, websocket_message.message)
+            message = await message_writer.write(
+                chat_id, user.id, websocket_message.message
+            )
             if message:
                 await manager.send_in_group(
-                    MessageSchema.model_validate(message).model_dump_json(), chat_id
+                    MessageSchema.model_validate(message).model_dump_json(),
+                    chat_id,
+                    message.id,
                 )
     except WebSocketDisconnect:
+        pass
+    finally:
         await manager.disconnect(websocket, chat_id, user)
+
+
+@router.websocket("/ws")
+async def multiplexed_websocket_endpoint(
+    websocket: WebSocket,
+    user: UserSnapshot = Depends(get_user_from_headers_websocket),
+):
+    """One socket per user for any number of chats.
+
+    Clients send ``subscribe``/``unsubscribe`` frames with a ``chat_id`` and
+    ``message`` frames carrying the ``chat_id`` they post to; every frame the
+    server sends is tagged with its ``chat_id``."""
+    connection = await manager.accept(websocket, user)
+    try:
+        while True:
+            data: str = await websocket.receive_text()
+            if not data:
+                continue
+            if not await admit_frame(connection, data):
+                continue
+            try:
+                frame = WebsocketMessage.model_validate_json(data)
+            except ValidationError:
+                await _reject_frame(connection, "Invalid frame")
+                continue
+            chat_id = frame.chat_id
+            if chat_id is None:
+                await _reject_frame(connection, "chat_id is required")
+                continue
+            # the chat comes from the frame, so it is charged once the socket
+            # is known to be subscribed to it
+            if (
+                frame.type in (MessageType.read, MessageType.send_message)
+                and chat_id not in connection.chats
+            ):
+                await connection.send(_error_frame("Not subscribed", chat_id))
+                continue
+            if not await admit_chat_frame(connection, frame.type, chat_id):
+                continue
+            frame_admitted(connection)
+            if frame.type == MessageType.subscribe:
+                if chat_id in connection.chats:
+                    continue
+                if len(connection.chats) >= settings.chat.max_subscriptions:
+                    await connection.send(
+                        _error_frame("Too many subscriptions", chat_id)
+                    )
+                elif not await check_access_to_chat(chat_id, user.id):
+                    await connection.send(_error_frame("Can`t access to chat", chat_id))
+                else:
+                    await manager.subscribe(connection, chat_id, frame.since)
+            elif frame.type == MessageType.unsubscribe:
+                await manager.unsubscribe(connection, chat_id)
+            elif frame.type == MessageType.read:
+                await mark_chat_read(chat_id, user.id, frame.message_id)
+            elif frame.type == MessageType.send_message:
+                message = await message_writer.write(chat_id, user.id, frame.message)
+                if message:
+                    await manager.send_in_group(
+                        MessageSchema.model_validate(message).model_dump_json(),
+                        chat_id,
+                        message.id,
+                    )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await manager.close(connection)
@@ -0,0 +1,124 @@
+import asyncio
+import sys
+import typing
+from enum import Enum
+from uuid import UUID
+
+from fastapi import WebSocket, status
+
+from auth.auth import UserSnapshot
+
+
+class OverflowPolicy(str, Enum):
+    drop_oldest = "drop_oldest"
+    disconnect = "disconnect"
+    block = "block"
+
+
+class Connection:
+    """Websocket with a bounded outbound queue drained by its own writer task,
+    so a slow client only ever delays itself."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user: UserSnapshot,
+        queue_size: int,
+        overflow_policy: OverflowPolicy,
+    ):
+        self.websocket = websocket
+        self.user = user
+        self.overflow_policy = overflow_policy
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        # set whenever the writer takes a frame off the queue or stops
+        self._room = asyncio.Event()
+        # chats this socket receives, one for /ws/{chat_id}, many for /ws
+        self.chats: typing.Set[UUID] = set()
+        # chat -> ids of messages replayed on subscribe, not delivered again
+        self.replayed: typing.Dict[UUID, typing.Set[int]] = {}
+        # inbound frames rejected in a row, see chat.chat.admit_frame
+        self.rejected_frames = 0
+        self._writer: typing.Optional[asyncio.Task] = None
+        self._closer: typing.Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        self.closed = True
+        self._room.set()
+        if self._writer is not None:
+            self._writer.cancel()
+
+    async def flush(self, timeout: float):
+        """Wait up to ``timeout`` for the writer to send what is queued, for
+        a last frame before the socket is closed."""
+        if self.closed:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def room(self) -> int:
+        if self.queue.maxsize <= 0:
+            return sys.maxsize
+        return self.queue.maxsize - self.queue.qsize()
+
+    async def wait_for_room(self, count: int) -> bool:
+        """Wait until ``count`` more frames fit into the queue (at most the
+        whole queue), whatever the overflow policy; False once closed."""
+        count = min(count, self.queue.maxsize)
+        while not self.closed and self.room() < count:
+            self._room.clear()
+            await self._room.wait()
+        return not self.closed
+
+    async def send_with_backpressure(self, message: str):
+        """Queue a frame that must not be dropped, waiting for space instead
+        of applying the overflow policy."""
+        if await self.wait_for_room(1):
+            self.queue.put_nowait(message)
+
+    async def send(self, message: str):
+        if self.closed:
+            return
+        if self.overflow_policy == OverflowPolicy.block:
+            # not queue.put: a publisher blocked on a full queue has to be
+            # released, and its frame dropped, once the connection stops
+            await self.send_with_backpressure(message)
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            if self.overflow_policy == OverflowPolicy.drop_oldest:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.queue.put_nowait(message)
+            else:
+                self._abort()
+
+    def _abort(self):
+        self.stop()
+        self._closer = asyncio.create_task(
+            self.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        )
+
+    async def _write_loop(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                self._room.set()
+                await self.websocket.send_text(message)
+                self.queue.task_done()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # socket is gone, the receive loop will report the disconnect;
+            # drain so that producers blocked on a full queue are released
+            self.closed = True
+            self._room.set()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.queue.task_done()
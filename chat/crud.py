@@ -1,17 +1,53 @@
-from uuid import UUID
+import json
+import typing
+from uuid import UUID, uuid4
 
-from sqlalchemy import select, insert, and_
-from sqlalchemy.orm import selectinload, subqueryload, contains_eager
+from sqlalchemy import (
+    select,
+    insert,
+    update,
+    bindparam,
+    and_,
+    tuple_,
+    func,
+    type_coerce,
+    String,
+    literal_column,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import (
+    selectinload,
+    subqueryload,
+    contains_eager,
+    noload,
+)
 
-from db.session import async_session_maker
-from models.chat import Chat, AssociationChatMembers, Message
+from config import settings
+from db.session import async_session_maker, async_read_session_maker
+from models.chat import (
+    Chat,
+    AssociationChatMembers,
+    Message,
+    message_fts,
+    message_fts_rank,
+)
 from fastapi_pagination.ext.sqlalchemy import paginate
 
 from models.user import User
+from utils.cache import TTLCache
+
+# wrap matched terms in the search snippet; control characters cannot clash
+# with message text and are replaced by markup after escaping
+SNIPPET_START, SNIPPET_END = "\x01", "\x02"
+
+# (chat_id, user_id) -> is member; membership only changes in create_chat_in_db
+membership_cache: TTLCache[typing.Tuple[UUID, int], bool] = TTLCache(
+    settings.chat.membership_cache_size, settings.chat.membership_cache_ttl
+)
 
 
 async def get_chat_from_db(chat_id: UUID):
-    async with async_session_maker() as session:
+    async with async_read_session_maker() as session:
         stmt = (
             select(Chat)
             .where(Chat.id == chat_id)
@@ -22,7 +58,10 @@ async def get_chat_from_db(chat_id: UUID):
 
 
 async def check_access_to_chat(chat_id: UUID, user_id: int):
-    async with async_session_maker() as session:
+    access = membership_cache.get((chat_id, user_id))
+    if access is not None:
+        return access
+    async with async_read_session_maker() as session:
         stmt = (
             select(AssociationChatMembers.chat_id)
             .filter_by(chat_id=chat_id, user_id=user_id)
@@ -30,99 +69,405 @@ async def check_access_to_chat(chat_id: UUID, user_id: int):
         )
         result = await session.execute(stmt)
         obj = result.unique().scalar_one_or_none()
-        if obj:
-            return True
-        return False
+    access = bool(obj)
+    membership_cache.set((chat_id, user_id), access)
+    return access
+
+
+def direct_chat_key(first_user_id: int, second_user_id: int) -> str:
+    return "{}:{}".format(*sorted((first_user_id, second_user_id)))
+
+
+def _chat_with_message_stmt(default_message_limit: int):
+    sbq_messages = (
+        select(Message.id)
+        .where(Message.chat_id == Chat.id)
+        .order_by(Message.created_at.desc())
+        .limit(default_message_limit)
+        .scalar_subquery()
+        .correlate(Chat)
+    )
+    return (
+        select(Chat)
+        .join(Chat.chat_members)
+        .outerjoin(Message, Message.id.in_(sbq_messages))
+        .options(contains_eager(Chat.messages))
+        .options(contains_eager(Chat.chat_members).load_only(User.id, User.email))
+    )
 
 
 async def get_chat_with_message(chat_id: UUID, default_message_limit: int = 1):
-    async with async_session_maker() as session:
-        sbq_messages = (
-            select(Message.id)
-            .where(Message.chat_id == Chat.id)
-            .order_by(Message.created_at.desc())
-            .limit(default_message_limit)
-            .scalar_subquery()
-            .correlate(Chat)
-        )
-        stmt = (
-            select(Chat)
-            .join(Chat.chat_members)
-            .filter(Chat.id == chat_id)
-            .outerjoin(Message, Message.id.in_(sbq_messages))
-            .options(contains_eager(Chat.messages))
-            .options(contains_eager(Chat.chat_members).load_only(User.id, User.email))
-        )
+    async with async_read_session_maker() as session:
+        stmt = _chat_with_message_stmt(default_message_limit).filter(Chat.id == chat_id)
         results = await session.execute(stmt)
     return results.unique().scalar_one_or_none()
 
 
-async def get_chats_by_user_id(user_id: int):
-    async with async_session_maker() as session:
-        stmt = (
-            select(Chat)
-            .options(selectinload(Chat.chat_members), selectinload(Chat.messages))
-            .where(AssociationChatMembers.user_id == user_id)
+async def get_direct_chat(
+    from_user_id: int, to_user_id: int, default_message_limit: int = 1
+):
+    key = direct_chat_key(from_user_id, to_user_id)
+    async with async_read_session_maker() as session:
+        stmt = _chat_with_message_stmt(default_message_limit).filter(
+            Chat.direct_key == key
         )
-        return await paginate(session, stmt)
-
+        results = await session.execute(stmt)
+    return results.unique().scalar_one_or_none()
 
-async def get_chat_uuid_by_users(from_user_id: int, to_user_id: int) -> UUID:
-    async with async_session_maker() as session:
-        sbq = (
-            select(AssociationChatMembers.chat_id)
-            .where(AssociationChatMembers.user_id == to_user_id)
-            .subquery()
-        )
 
+async def get_chats_by_user_id(user_id: int):
+    async with async_read_session_maker() as session:
         stmt = (
-            select(AssociationChatMembers.chat_id)
-            .where(
+            select(Chat).join(
+                AssociationChatMembers,
                 and_(
-                    AssociationChatMembers.user_id == from_user_id,
-                    AssociationChatMembers.chat_id.in_(sbq),
-                )
+                    AssociationChatMembers.chat_id == Chat.id,
+                    AssociationChatMembers.user_id == user_id,
+                ),
             )
-            .limit(1)
+            # previews come from the inbox, the full history is never loaded
+            .options(selectinload(Chat.chat_members), noload(Chat.messages))
         )
-        result = await session.execute(stmt)
-        return result.scalar_one_or_none()
+        return await paginate(session, stmt)
 
 
 async def create_chat_in_db(from_user_id: int, to_user_id: int):
     # не создавать чат с несуществующим пользователем
-    users = [from_user_id, to_user_id]
+    users = sorted({from_user_id, to_user_id})
+    key = direct_chat_key(from_user_id, to_user_id)
     async with async_session_maker() as session:
-        chat = Chat()
-        session.add(chat)
-        await session.flush()
-        await session.refresh(chat)
-        chat_members = [{"user_id": user, "chat_id": chat.id} for user in users]
-        await session.execute(insert(AssociationChatMembers), chat_members)
+        # the unique direct_key makes concurrent creators converge on one chat:
+        # the loser's insert is a no-op and it reads the winner's row below
+        chat_id = uuid4()
+        result = await session.execute(
+            sqlite_insert(Chat)
+            .values(id=chat_id, direct_key=key)
+            .on_conflict_do_nothing(index_elements=[Chat.direct_key])
+        )
+        if result.rowcount:
+            chat_members = [{"user_id": user, "chat_id": chat_id} for user in users]
+            await session.execute(insert(AssociationChatMembers), chat_members)
         await session.commit()
+        if result.rowcount:
+            for user in users:
+                membership_cache.invalidate((chat_id, user))
         results = await session.execute(
-            select(Chat)
-            .options(selectinload(Chat.chat_members), selectinload(Chat.messages))
-            .where(Chat.id == chat.id)
-            .limit(1)
+            _chat_with_message_stmt(1).filter(Chat.direct_key == key)
         )
         return results.unique().scalar_one_or_none()
 
 
-async def create_message(chat_id: UUID, author_id: int, text: str):
-    message = Message(chat_id=chat_id, author_id=author_id, text=text)
+async def create_messages(messages: typing.List[dict]) -> typing.List[Message]:
     async with async_session_maker() as session:
-        session.add(message)
+        # sort_by_parameter_order makes SQLite fall back to one INSERT per row;
+        # ids grow in VALUES order, so sorting by id restores parameter order
+        stmt = insert(Message).returning(Message)
+        result = await session.execute(stmt, messages)
+        created = sorted(result.scalars().all(), key=lambda message: message.id)
+        await _count_unread(session, created)
         await session.commit()
-        await session.refresh(message)
-    return message
+    return created
 
 
-async def get_messages_from_db(chat_id: UUID):
+async def _count_unread(session, messages: typing.List[Message]):
+    """Move read markers and unread counters along with new messages, in the
+    transaction that inserts them (``messages`` sorted by id).
+
+    Authors have read their chat up to their own last message. Every run of
+    consecutive messages by one author in a chat is unread for the other
+    members whose marker is older than the run; a marker moved by this batch
+    never falls inside another author's run, so runs count whole."""
+    read_markers: typing.Dict[typing.Tuple[UUID, int], int] = {}
+    runs: typing.List[dict] = []
+    last_run: typing.Dict[UUID, dict] = {}
+    for message in messages:
+        read_markers[(message.chat_id, message.author_id)] = message.id
+        run = last_run.get(message.chat_id)
+        if run is not None and run["b_author_id"] == message.author_id:
+            run["b_count"] += 1
+            continue
+        run = {
+            "b_chat_id": message.chat_id,
+            "b_author_id": message.author_id,
+            "b_first_id": message.id,
+            "b_count": 1,
+        }
+        last_run[message.chat_id] = run
+        runs.append(run)
+    members = AssociationChatMembers.__table__
+    await session.execute(
+        update(members)
+        .where(
+            members.c.chat_id == bindparam("b_chat_id"),
+            members.c.user_id == bindparam("b_user_id"),
+        )
+        .values(last_read_message_id=bindparam("b_message_id"), unread_count=0),
+        [
+            {"b_chat_id": chat_id, "b_user_id": user_id, "b_message_id": message_id}
+            for (chat_id, user_id), message_id in read_markers.items()
+        ],
+    )
+    await session.execute(
+        update(members)
+        .where(
+            members.c.chat_id == bindparam("b_chat_id"),
+            members.c.user_id != bindparam("b_author_id"),
+            members.c.last_read_message_id < bindparam("b_first_id"),
+        )
+        .values(unread_count=members.c.unread_count + bindparam("b_count")),
+        runs,
+    )
+
+
+async def mark_chat_read(
+    chat_id: UUID, user_id: int, message_id: typing.Optional[int] = None
+) -> typing.Optional[AssociationChatMembers]:
+    """Move the user's read marker forward to ``message_id`` (the latest
+    message by default) and recount what is left after it.
+
+    ``message_id`` comes from the client and is clamped to the chat's latest
+    message: a marker past it would hide every later message from the
+    counters kept by ``_count_unread``."""
     async with async_session_maker() as session:
+        latest = (
+            await session.execute(
+                select(func.max(Message.id)).where(Message.chat_id == chat_id)
+            )
+        ).scalar() or 0
+        if message_id is None or message_id > latest:
+            message_id = latest
+        unread = (
+            select(func.count(Message.id))
+            .where(
+                Message.chat_id == chat_id,
+                Message.id > message_id,
+                Message.author_id != user_id,
+            )
+            .scalar_subquery()
+        )
+        await session.execute(
+            update(AssociationChatMembers)
+            .where(
+                AssociationChatMembers.chat_id == chat_id,
+                AssociationChatMembers.user_id == user_id,
+                AssociationChatMembers.last_read_message_id < message_id,
+            )
+            .values(last_read_message_id=message_id, unread_count=unread)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        result = await session.execute(
+            select(AssociationChatMembers).filter_by(chat_id=chat_id, user_id=user_id)
+        )
+    return result.scalar_one_or_none()
+
+
+async def get_unread_counters(user_id: int) -> typing.List[AssociationChatMembers]:
+    # served by the (user_id, chat_id) primary key
+    async with async_read_session_maker() as session:
+        result = await session.execute(
+            select(AssociationChatMembers).where(
+                AssociationChatMembers.user_id == user_id
+            )
+        )
+    return list(result.scalars().all())
+
+
+async def get_messages_from_db(chat_id: UUID):
+    async with async_read_session_maker() as session:
         stmt = (
             select(Message)
             .where(Message.chat_id == chat_id)
             .order_by(Message.created_at.desc())
         )
         return await paginate(session, stmt)
+
+
+async def get_messages_by_cursor(
+    chat_id: UUID,
+    limit: int,
+    before: typing.Optional[typing.Tuple[str, int]] = None,
+    after: typing.Optional[typing.Tuple[str, int]] = None,
+) -> typing.Tuple[typing.List[Message], typing.List[typing.Tuple[str, int]], bool]:
+    """A page of messages with the cursor key of each one.
+
+    Keys hold ``created_at`` as stored text, like ``get_inbox``: legacy rows
+    have no microseconds, so a bound datetime would not round-trip and the
+    page boundary would repeat."""
+    # (created_at, id) row values are served by ix_message_chat_id_created_at_id,
+    # so every page is an index range scan no matter how deep it is
+    created_at = type_coerce(Message.created_at, String)
+    key = tuple_(created_at, Message.id)
+    stmt = select(Message, created_at.label("created_at_key")).where(
+        Message.chat_id == chat_id
+    )
+    if after is not None:
+        stmt = stmt.where(key > after).order_by(
+            Message.created_at.asc(), Message.id.asc()
+        )
+    else:
+        if before is not None:
+            stmt = stmt.where(key < before)
+        stmt = stmt.order_by(Message.created_at.desc(), Message.id.desc())
+    async with async_read_session_maker() as session:
+        result = await session.execute(stmt.limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+    messages = [row.Message for row in rows]
+    keys = [(row.created_at_key, row.Message.id) for row in rows]
+    return messages, keys, has_more
+
+
+async def stream_messages(
+    chat_id: UUID, batch_size: int
+) -> typing.AsyncIterator[typing.Sequence[Message]]:
+    """Whole chat history oldest first, one keyset page per short session.
+
+    No connection or read snapshot is held while a batch is with the client,
+    so slow downloads never starve the read pool or hold back WAL
+    checkpoints; messages written meanwhile are picked up by later pages."""
+    created_at = type_coerce(Message.created_at, String)
+    stmt = (
+        select(Message, created_at.label("created_at_key"))
+        .where(Message.chat_id == chat_id)
+        .order_by(Message.created_at.asc(), Message.id.asc())
+        .limit(batch_size)
+    )
+    key = None
+    while True:
+        page = stmt if key is None else stmt.where(tuple_(created_at, Message.id) > key)
+        async with async_read_session_maker() as session:
+            rows = (await session.execute(page)).all()
+        if not rows:
+            return
+        yield [row.Message for row in rows]
+        if len(rows) < batch_size:
+            return
+        key = rows[-1].created_at_key, rows[-1].Message.id
+
+
+def fts_query(query: str) -> str:
+    """Every word as a quoted FTS5 string, so user input is matched literally
+    (all words must occur) and never parsed as query syntax."""
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in query.split()]
+    if not terms:
+        raise ValueError("Empty search query")
+    return " ".join(terms)
+
+
+async def search_messages(
+    user_id: int,
+    query: str,
+    limit: int,
+    after: typing.Optional[typing.Tuple[float, int]] = None,
+    chat_id: typing.Optional[UUID] = None,
+):
+    """Messages from the user's chats matching ``query``, best match first.
+
+    Returns ``(message, rank, snippet)`` rows and whether there are more;
+    ``(rank, id)`` of the last row is the key of the next page."""
+    snippet = func.snippet(
+        literal_column("message_fts"), 0, SNIPPET_START, SNIPPET_END, "…", 16
+    )
+    stmt = (
+        select(Message, message_fts_rank.label("rank"), snippet.label("snippet"))
+        .select_from(message_fts)
+        .join(Message, Message.id == message_fts.c.rowid)
+        .join(
+            AssociationChatMembers,
+            and_(
+                AssociationChatMembers.chat_id == Message.chat_id,
+                AssociationChatMembers.user_id == user_id,
+            ),
+        )
+        .where(literal_column("message_fts").op("MATCH")(fts_query(query)))
+        .order_by(message_fts_rank, Message.id)
+        .limit(limit + 1)
+    )
+    if chat_id is not None:
+        stmt = stmt.where(Message.chat_id == chat_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(message_fts_rank, Message.id) > after)
+    async with async_read_session_maker() as session:
+        rows = (await session.execute(stmt)).all()
+    return rows[:limit], len(rows) > limit
+
+
+async def get_inbox(
+    user_id: int,
+    limit: int,
+    before: typing.Optional[typing.Tuple[str, UUID]] = None,
+):
+    def latest(column):
+        return (
+            select(column)
+            .where(Message.chat_id == Chat.id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+            .correlate(Chat)
+            .scalar_subquery()
+        )
+
+    # compared as stored text: legacy rows have no microseconds, so a bound
+    # datetime would not round-trip to the same value
+    last_activity = type_coerce(
+        func.coalesce(latest(Message.created_at), Chat.created_at), String
+    )
+    page = (
+        select(
+            Chat.id.label("chat_id"),
+            Chat.created_at.label("chat_created_at"),
+            latest(Message.id).label("last_message_id"),
+            last_activity.label("last_activity"),
+            AssociationChatMembers.unread_count,
+        )
+        .join(
+            AssociationChatMembers,
+            and_(
+                AssociationChatMembers.chat_id == Chat.id,
+                AssociationChatMembers.user_id == user_id,
+            ),
+        )
+        .order_by(last_activity.desc(), Chat.id.desc())
+        .limit(limit + 1)
+    )
+    if before is not None:
+        page = page.where(tuple_(last_activity, Chat.id) < before)
+    page = page.subquery()
+    # members come along as one JSON array per chat, so the page is a
+    # single statement
+    members = (
+        select(
+            func.json_group_array(func.json_object("id", User.id, "email", User.email))
+        )
+        .select_from(AssociationChatMembers)
+        .join(User, User.id == AssociationChatMembers.user_id)
+        .where(AssociationChatMembers.chat_id == page.c.chat_id)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(page, Message, members.label("chat_members"))
+        .outerjoin(Message, Message.id == page.c.last_message_id)
+        .order_by(page.c.last_activity.desc(), page.c.chat_id.desc())
+    )
+    async with async_read_session_maker() as session:
+        rows = (await session.execute(stmt)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return [
+        {
+            "id": row.chat_id,
+            "created_at": row.chat_created_at,
+            "last_activity": row.Message.created_at
+            if row.Message
+            else row.chat_created_at,
+            "last_message": row.Message,
+            "chat_members": json.loads(row.chat_members),
+            "unread_count": row.unread_count,
+            "cursor": (row.last_activity, row.chat_id),
+        }
+        for row in rows
+    ], has_more
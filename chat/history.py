@@ -0,0 +1,101 @@
+import asyncio
+import bisect
+import typing
+from collections import deque
+from uuid import UUID
+
+from schemas.chat_schemas import MessageSchema
+from utils.cache import TTLCache
+from .crud import get_messages_by_cursor
+
+
+class Buffer(deque):
+    """(message id, serialized MessageSchema) pairs in id order.
+
+    Workers dispatch their own messages before those polled from the
+    others, so ids can arrive out of order; each is inserted in its place."""
+
+    def __init__(self, frames: typing.Iterable[typing.Tuple[int, str]], size: int):
+        super().__init__(frames, maxlen=size)
+        # newest message that arrived below the window of a full buffer
+        self.missing = 0
+
+    def add(self, message_id: int, payload: str):
+        index = bisect.bisect_left(self, message_id, key=lambda frame: frame[0])
+        # a message committed before the buffer was loaded is already in
+        # it, its dispatch may still arrive afterwards
+        if index < len(self) and self[index][0] == message_id:
+            return
+        if len(self) == self.maxlen:
+            if index == 0:
+                self.missing = max(self.missing, message_id)
+                return
+            self.popleft()
+            index -= 1
+        self.insert(index, (message_id, payload))
+
+
+class MessageHistory:
+    """The last ``size`` messages of recently used chats, kept as the exact
+    frames sent to websockets so that a (re)connecting socket is backfilled
+    without a query.
+
+    Buffers are fed by every message the manager dispatches and loaded from
+    the database once per chat on first use; concurrent first uses share
+    that single query."""
+
+    def __init__(self, size: int, max_chats: int, ttl: float):
+        self.size = size
+        self._buffers: TTLCache[UUID, Buffer] = TTLCache(max_chats, ttl)
+        self._loading: typing.Dict[UUID, asyncio.Task] = {}
+        # messages dispatched while the chat's buffer is being loaded
+        self._pending: typing.Dict[UUID, typing.List[typing.Tuple[int, str]]] = {}
+
+    def stats(self) -> typing.Dict[str, int]:
+        return self._buffers.stats()
+
+    def append(self, chat_id: UUID, message_id: int, payload: str):
+        buffer = self._buffers.get(chat_id)
+        if buffer is not None:
+            buffer.add(message_id, payload)
+        elif chat_id in self._pending:
+            self._pending[chat_id].append((message_id, payload))
+
+    async def recent(
+        self, chat_id: UUID, since: typing.Optional[int] = None
+    ) -> typing.Tuple[typing.List[typing.Tuple[int, str]], bool]:
+        """Buffered (message id, frame) pairs oldest first, only those after
+        message ``since``, and whether they are all of them: a full buffer may
+        have evicted older messages the caller asked for."""
+        buffer = self._buffers.get(chat_id)
+        if buffer is None:
+            task = self._loading.get(chat_id)
+            if task is None:
+                task = asyncio.create_task(self._load(chat_id))
+                self._loading[chat_id] = task
+            buffer = await asyncio.shield(task)
+        frames = [
+            (message_id, payload)
+            for message_id, payload in buffer
+            if since is None or message_id > since
+        ]
+        complete = (since or 0) >= buffer.missing and (
+            len(buffer) < self.size or (since is not None and buffer[0][0] <= since)
+        )
+        return frames, complete
+
+    async def _load(self, chat_id: UUID) -> Buffer:
+        self._pending[chat_id] = []
+        try:
+            messages, _, _ = await get_messages_by_cursor(chat_id, self.size)
+            frames = {
+                message.id: MessageSchema.model_validate(message).model_dump_json()
+                for message in messages
+            }
+            frames.update(self._pending[chat_id])
+            buffer = Buffer(sorted(frames.items())[-self.size :], self.size)
+            self._buffers.set(chat_id, buffer)
+            return buffer
+        finally:
+            del self._pending[chat_id]
+            del self._loading[chat_id]
@@ -0,0 +1,65 @@
+import typing
+from uuid import UUID
+
+from schemas.users_schemas import ShortUserRead
+
+
+class PresenceRegistry:
+    """Who is online in which chat, by user id only.
+
+    Every websocket counts once per (chat, user), so a user with several tabs
+    open stays online until the last one closes. The reverse user -> chats
+    index answers "is this user online anywhere" without scanning chats."""
+
+    def __init__(self):
+        self._connections: typing.Dict[UUID, typing.Dict[int, int]] = {}
+        self._chats: typing.Dict[int, typing.Set[UUID]] = {}
+        # kept while the user is online anywhere, presence frames carry it
+        self._emails: typing.Dict[int, str] = {}
+
+    def add(self, chat_id: UUID, user: ShortUserRead) -> bool:
+        """Count a new connection, True if the user just came online in the chat."""
+        users = self._connections.setdefault(chat_id, {})
+        count = users.get(user.id, 0)
+        users[user.id] = count + 1
+        if count:
+            return False
+        self._chats.setdefault(user.id, set()).add(chat_id)
+        self._emails[user.id] = user.email
+        return True
+
+    def remove(self, chat_id: UUID, user_id: int) -> bool:
+        """Drop a connection, True if it was the user's last one in the chat."""
+        users = self._connections.get(chat_id)
+        if not users or user_id not in users:
+            return False
+        users[user_id] -= 1
+        if users[user_id]:
+            return False
+        del users[user_id]
+        if not users:
+            del self._connections[chat_id]
+        chats = self._chats[user_id]
+        chats.discard(chat_id)
+        if not chats:
+            del self._chats[user_id]
+            del self._emails[user_id]
+        return True
+
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self._chats
+
+    def is_online_in(self, chat_id: UUID, user_id: int) -> bool:
+        return user_id in self._connections.get(chat_id, ())
+
+    def chats_of(self, user_id: int) -> typing.AbstractSet[UUID]:
+        return self._chats.get(user_id, frozenset())
+
+    def user_ids(self, chat_id: UUID) -> typing.KeysView[int]:
+        return self._connections.get(chat_id, {}).keys()
+
+    def users(self, chat_id: UUID) -> typing.List[ShortUserRead]:
+        return [
+            ShortUserRead.model_construct(id=user_id, email=self._emails[user_id])
+            for user_id in self.user_ids(chat_id)
+        ]
@@ -0,0 +1,88 @@
+import asyncio
+import typing
+from datetime import datetime, timezone
+from uuid import UUID
+
+from config import settings
+from models.chat import Message
+from .crud import create_messages
+
+
+class MessageWriter:
+    """Group commit for chat messages: senders from every chat are collected
+    for ``batch_window`` seconds and persisted with one multi-row
+    INSERT ... RETURNING and a single commit."""
+
+    def __init__(self, batch_window: float, batch_size: int):
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue[typing.Tuple[dict, asyncio.Future]] = asyncio.Queue()
+        self._task: typing.Optional[asyncio.Task] = None
+        # True while _run waits for the next message, i.e. holds no batch
+        self._idle = True
+        self._stopping = False
+
+    async def write(self, chat_id: UUID, author_id: int, text: str) -> Message:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        values = {
+            "chat_id": chat_id,
+            "author_id": author_id,
+            "text": text,
+            "created_at": datetime.now(timezone.utc),
+        }
+        self._queue.put_nowait((values, future))
+        return await future
+
+    async def stop(self):
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        if self._idle:
+            task.cancel()
+        else:
+            # a batch is in flight, cancelling would leave its senders waiting
+            self._stopping = True
+            await task
+            self._stopping = False
+        while not self._queue.empty():
+            await self._flush(self._take(self.batch_size))
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            self._idle = True
+            first = await self._queue.get()
+            self._idle = False
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            await self._flush([first] + self._take(self.batch_size - 1))
+        self._idle = True
+
+    def _take(self, limit: int) -> typing.List[typing.Tuple[dict, asyncio.Future]]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: typing.List[typing.Tuple[dict, asyncio.Future]]):
+        try:
+            messages = await create_messages([values for values, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(exc)
+                return
+            # retry one by one so a single bad row only fails its own sender
+            for item in batch:
+                await self._flush([item])
+            return
+        for (_, future), message in zip(batch, messages):
+            if not future.done():
+                future.set_result(message)
+
+
+message_writer = MessageWriter(
+    settings.chat.write_batch_window, settings.chat.write_batch_size
+)
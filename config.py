@@ -1,8 +1,9 @@
 import os
+import typing
 from pathlib import Path
 import dotenv
-from pydantic import BaseModel
-from pydantic_settings import BaseSettings
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 dotenv.load_dotenv()
 
@@ -12,11 +13,98 @@ class DbSettings(BaseModel):
     db_path: Path = Path(__file__).parent / "db.sqlite3"
     url: str = f"sqlite+aiosqlite:///{db_path}"
     url_sync: str = f"sqlite:///{db_path}"
-    echo: bool = True
+    echo: bool = False
+    # "production" runs SQLite in WAL mode with tuned pragmas, pooled
+    # connections and a separate read-only pool; "default" is plain SQLAlchemy
+    profile: typing.Literal["default", "production"] = "production"
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    read_pool_size: int = 10
+    read_max_overflow: int = 20
+    busy_timeout: int = 5000
+    cache_size: int = -64_000
+    mmap_size: int = 256 * 1024 * 1024
+
+
+class ChatSettings(BaseModel):
+    # outbound frames buffered per websocket before the overflow policy kicks in
+    send_queue_size: int = 256
+    overflow_policy: typing.Literal[
+        "drop_oldest", "disconnect", "block"
+    ] = "drop_oldest"
+    # "sqlite" shares chat events between uvicorn workers through backplane_path
+    backplane: typing.Literal["memory", "sqlite"] = "memory"
+    backplane_path: Path = Path(__file__).parent / "backplane.sqlite3"
+    backplane_poll_interval: float = 0.05
+    backplane_retention: int = 60
+    # workers beat this often; the users of a worker silent for
+    # backplane_presence_ttl seconds are dropped by the others
+    backplane_heartbeat_interval: float = 2
+    backplane_presence_ttl: float = 10
+    # chats one multiplexed /chat/ws socket may subscribe to
+    max_subscriptions: int = 1000
+    # recent messages replayed to every socket that (re)connects to a chat,
+    # cut to send_queue_size
+    history_size: int = Field(50, gt=0)
+    history_cache_size: int = 10_000
+    history_ttl: float = 3600
+    # presence changes are merged for this long into one delta frame per chat
+    presence_debounce: float = 0.2
+    # inbound frames per second (sustained) and burst, checked before parsing;
+    # buckets are per worker process
+    user_rate: float = 5
+    user_burst: int = 20
+    chat_rate: float = 20
+    chat_burst: int = 50
+    max_frame_size: int = 8192
+    # consecutive rejected frames before the socket is closed, after waiting
+    # at most close_flush_timeout seconds for its queued frames to go out
+    flood_disconnect_after: int = 100
+    close_flush_timeout: float = 1
+    # inbound messages are grouped for this long and written in one transaction
+    write_batch_window: float = 0.005
+    write_batch_size: int = 500
+    # rows per page of the history export, each read in its own short session
+    export_batch_size: int = 1000
+    membership_cache_size: int = 100_000
+    membership_cache_ttl: float = 300
+
+
+class AuthSettings(BaseModel):
+    # verified tokens are cached until they expire, at most token_cache_ttl;
+    # user updates invalidate the cache of their own worker only, so other
+    # workers may accept a deactivated or deleted user for up to this long
+    token_cache_size: int = 100_000
+    token_cache_ttl: float = 30
+
+
+class AreaSettings(BaseModel):
+    # rows per transaction of the bulk import, bounds its memory use
+    import_chunk_size: int = 1000
+    # rows loaded per requested result of a nearby search, ordered by an
+    # approximate distance before the exact one decides
+    near_candidate_factor: int = 4
+
+
+class GraphQLSettings(BaseModel):
+    max_depth: int = 8
+    max_aliases: int = 15
+    max_tokens: int = 2000
+    # parsed and validated documents kept per process
+    document_cache_size: int = 256
+    persisted_query_cache_size: int = 1000
+    persisted_query_ttl: float = 24 * 3600
 
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_nested_delimiter="__")
+
     db: DbSettings = DbSettings()
+    chat: ChatSettings = ChatSettings()
+    auth: AuthSettings = AuthSettings()
+    area: AreaSettings = AreaSettings()
+    graphql: GraphQLSettings = GraphQLSettings()
     secret: str = "secret"
 
 
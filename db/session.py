@@ -1,17 +1,108 @@
+import typing
+from dataclasses import dataclass, field
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession, AsyncEngine
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from config import settings
+from config import settings, DbSettings
 from models.base_model import Base
 
-engine = create_async_engine(
-    settings.db.url,
-    echo=settings.db.echo
+
+@dataclass
+class EngineProfile:
+    # PRAGMAs run on every new SQLite connection
+    pragmas: typing.Dict[str, typing.Union[str, int]] = field(default_factory=dict)
+    # pooled connections keep their pragmas and page cache between sessions
+    pooled: bool = False
+    # queries go through a separate query_only pool, so a read never waits
+    # for a free connection behind message writes
+    read_split: bool = False
+
+
+def get_engine_profile(db: DbSettings) -> EngineProfile:
+    if db.profile == "production":
+        return EngineProfile(
+            pragmas={
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "busy_timeout": db.busy_timeout,
+                "cache_size": db.cache_size,
+                "mmap_size": db.mmap_size,
+                "temp_store": "MEMORY",
+            },
+            pooled=True,
+            read_split=True,
+        )
+    return EngineProfile()
+
+
+def _is_file_sqlite(url: str) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def _set_pragmas(engine: AsyncEngine, pragmas: typing.Dict[str, typing.Any]):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_engines(db: DbSettings) -> typing.Tuple[AsyncEngine, AsyncEngine]:
+    """Build the read-write engine and the engine for read-only query paths,
+    which is the same engine unless the profile splits them."""
+    profile = get_engine_profile(db)
+    # an in-memory database is private to its connection, nothing to split
+    file_db = _is_file_sqlite(db.url)
+    pooled = profile.pooled and file_db
+
+    def build(pool_size: int, max_overflow: int, pragmas: dict) -> AsyncEngine:
+        options = {}
+        if pooled:
+            options = dict(
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=db.pool_timeout,
+            )
+        engine = create_async_engine(db.url, echo=db.echo, **options)
+        if pragmas and file_db:
+            _set_pragmas(engine, pragmas)
+        return engine
+
+    engine = build(db.pool_size, db.max_overflow, profile.pragmas)
+    if not (profile.read_split and file_db):
+        return engine, engine
+    read_engine = build(
+        db.read_pool_size,
+        db.read_max_overflow,
+        {**profile.pragmas, "query_only": "ON"},
+    )
+    return engine, read_engine
+
+
+engine, read_engine = create_engines(settings.db)
+async_session_maker = async_sessionmaker(
+    engine,
+    expire_on_commit=False,
+    autoflush=False,
+)
+# sessions for queries only, writes through them fail with "readonly database"
+async_read_session_maker = async_sessionmaker(
+    read_engine,
+    expire_on_commit=False,
+    autoflush=False,
 )
-async_session_maker = async_sessionmaker(engine, expire_on_commit=False,
-                                         autoflush=False, )
 
 
 async def create_db_and_tables():
@@ -19,6 +110,12 @@ async def create_db_and_tables():
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def dispose_engines():
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
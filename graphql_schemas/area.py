@@ -2,14 +2,17 @@ import typing
 from decimal import Decimal
 
 import strawberry
+from strawberry.types import Info
 
 from graphql_schemas.base import Base, BaseInput
 from graphql_schemas.pagination import LimitOffsetPage
+from graphql_schemas.user import UserQL
 
 
 @strawberry.type
 class Room(Base):
     name: str
+    area_id: strawberry.Private[int]
 
 
 @strawberry.input
@@ -29,9 +32,25 @@ class Area(Base):
     latitude: Decimal
     longtitude: Decimal
     address: str
-    rooms: typing.List[Room]
+    user_id: strawberry.Private[int]
+
+    # resolved through the request's loaders, so nothing is fetched unless the
+    # field is selected and sibling areas share one batched query
+    @strawberry.field
+    async def rooms(self, info: Info) -> typing.List[Room]:
+        return await info.context.rooms_by_area_id.load(self.id)
+
+    @strawberry.field
+    async def user(self, info: Info) -> typing.Optional[UserQL]:
+        return await info.context.users_by_id.load(self.user_id)
 
 
 @strawberry.type
 class AreaPage(LimitOffsetPage[Area]):
     pass
+
+
+@strawberry.type
+class NearbyArea:
+    area: Area
+    distance_km: float
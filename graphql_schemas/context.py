@@ -1,18 +1,27 @@
+import typing
+
 import asyncstdlib
+from strawberry.dataloader import DataLoader
 from strawberry.fastapi import BaseContext
 from strawberry.types.info import RootValueType
 
-from auth.auth import read_token_func, UserManager
+from auth.auth import read_token_func, UserSnapshot
 from graphQL_exception.auth import AuthError
+from graphql_schemas.area import Area as AreaSchema
 from graphql_schemas.user import UserQL
-from models.user import User
+from loaders.area import load_areas_by_ids, load_rooms_by_area_ids
+from loaders.user import load_users_by_ids
 from strawberry.types import Info as _Info
 
 
 class Context(BaseContext):
-    def __init__(self, user_manager: UserManager):
+    def __init__(self):
         super().__init__()
-        self.user_manager = user_manager
+        # one set of loaders per request: batching and caching never leak
+        # between users
+        self.areas_by_id = DataLoader(load_fn=self._load_areas)
+        self.rooms_by_area_id = DataLoader(load_fn=load_rooms_by_area_ids)
+        self.users_by_id = DataLoader(load_fn=load_users_by_ids)
 
     @asyncstdlib.cached_property
     async def user(self) -> UserQL | None:
@@ -21,10 +30,18 @@ class Context(BaseContext):
 
         authorization: str = self.request.headers.get("Authorization", None)
         try:
-            user_obj: User = await read_token_func(authorization, self.user_manager)
+            user_obj: UserSnapshot = await read_token_func(authorization)
         except AuthError:
             return None
-        return UserQL(id=user_obj.id)
+        return UserQL(id=user_obj.id, email=user_obj.email)
+
+    async def _load_areas(
+        self, keys: typing.List[int]
+    ) -> typing.List[AreaSchema | None]:
+        user = await self.user
+        if user is None:
+            return [None] * len(keys)
+        return await load_areas_by_ids(user.id, keys)
 
 
 Info = _Info[Context, RootValueType]
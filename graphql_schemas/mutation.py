@@ -23,7 +23,6 @@ class Mutation:
             latitude=area.latitude,
             longtitude=area.longtitude,
             address=area.address,
-            rooms=[],
             user_id=user_id,
         )
         return area_s
@@ -41,7 +40,6 @@ class Mutation:
         self, rooms: typing.List[RoomInput | None]
     ) -> typing.List[RoomSchema]:
         rooms = [room.__dict__ for room in rooms]
-        print(rooms)
         rooms_obj: typing.List[Room] = await create_rooms(rooms)
         output_rooms = [
             RoomSchema(
@@ -3,14 +3,18 @@ import typing
 import strawberry
 
 from area.crud import get_my_areas
-from graphql_schemas.area import AreaPage, Area as AreaSchema
+from graphql_schemas.area import AreaPage, Area as AreaSchema, NearbyArea
 from graphql_schemas.base import LimitOffsetInput
 from graphql_schemas.context import Info
+from graphql_schemas.selection import selected_field_names
 from graphql_schemas.user import UserQL
-from loaders.area import load_my_areas
+from loaders.area import load_my_areas, load_areas_near
 from models.area import Area
 from permissions.auth import IsAuthenticated
 
+MAX_NEAR_RADIUS_KM = 500
+MAX_NEAR_LIMIT = 100
+
 
 @strawberry.type
 class Query:
@@ -22,8 +26,15 @@ class Query:
         keys: typing.Optional[typing.List[int]] = None,
     ) -> AreaPage:
         user: UserQL | None = await info.context.user
+        selected = selected_field_names(info)
+        # count stays None when it is not selected, so it is never resolved
         areas, count = await load_my_areas(
-            user.id, pagination.limit, pagination.offset, keys
+            user.id,
+            pagination.limit,
+            pagination.offset,
+            keys,
+            with_items="items" in selected,
+            with_count="count" in selected,
         )
         return AreaPage(
             limit=pagination.limit,
@@ -32,6 +43,21 @@ class Query:
             items=areas,
         )
 
+    @strawberry.field(permission_classes=[IsAuthenticated])
+    async def area(self, id: int, info: Info) -> typing.Optional[AreaSchema]:
+        return await info.context.areas_by_id.load(id)
+
+    @strawberry.field(permission_classes=[IsAuthenticated])
+    async def areas_near(
+        self, lat: float, lon: float, radius_km: float, info: Info, limit: int = 20
+    ) -> typing.List[NearbyArea]:
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("Coordinates are out of range")
+        if not 0 < radius_km <= MAX_NEAR_RADIUS_KM or not 0 < limit <= MAX_NEAR_LIMIT:
+            raise ValueError("radiusKm or limit is out of range")
+        user: UserQL | None = await info.context.user
+        return await load_areas_near(user.id, lat, lon, radius_km, limit)
+
     # @strawberry.field
     # async def rooms(self):
     #     return []
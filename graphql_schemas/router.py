@@ -0,0 +1,86 @@
+import hashlib
+import typing
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from strawberry.fastapi import GraphQLRouter
+from strawberry.http import GraphQLRequestData
+from strawberry.http.async_base_view import AsyncHTTPRequestAdapter
+
+from config import settings
+from utils.cache import TTLCache
+
+# sha256 hex digest -> query document, shared by every request of the process
+persisted_queries: TTLCache[str, str] = TTLCache(
+    settings.graphql.persisted_query_cache_size, settings.graphql.persisted_query_ttl
+)
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def resolve_persisted_query(
+    query: typing.Optional[str], extensions: typing.Optional[dict]
+) -> typing.Optional[str]:
+    persisted = (extensions or {}).get("persistedQuery")
+    if not persisted:
+        return query
+    sha256_hash = persisted.get("sha256Hash")
+    if persisted.get("version") != 1 or not sha256_hash:
+        raise PersistedQueryError(
+            "Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED"
+        )
+    if query is None:
+        query = persisted_queries.get(sha256_hash)
+        if query is None:
+            raise PersistedQueryError(
+                "PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND"
+            )
+        return query
+    if hashlib.sha256(query.encode()).hexdigest() != sha256_hash:
+        raise PersistedQueryError("provided sha does not match query", "BAD_REQUEST")
+    persisted_queries.set(sha256_hash, query)
+    return query
+
+
+class PersistedQueryRouter(GraphQLRouter):
+    """GraphQLRouter speaking the Automatic Persisted Queries protocol: clients
+    send only the sha256 of a document once the server has seen it."""
+
+    def should_render_graphiql(self, request: AsyncHTTPRequestAdapter) -> bool:
+        # a hash-only GET carries no "query" but is not a browser visit
+        if request.query_params.get("extensions") is not None:
+            return False
+        return super().should_render_graphiql(request)
+
+    async def parse_http_body(
+        self, request: AsyncHTTPRequestAdapter
+    ) -> GraphQLRequestData:
+        content_type = request.content_type or ""
+        if "application/json" in content_type:
+            data = self.parse_json(await request.get_body())
+            extensions = data.get("extensions")
+        elif request.method == "GET":
+            data = self.parse_query_params(request.query_params)
+            extensions = data.get("extensions")
+            if isinstance(extensions, str):
+                extensions = self.parse_json(extensions)
+        else:
+            return await super().parse_http_body(request)
+        return GraphQLRequestData(
+            query=resolve_persisted_query(data.get("query"), extensions),
+            variables=data.get("variables"),
+            operation_name=data.get("operationName"),
+        )
+
+    async def run(self, request: Request, *args, **kwargs) -> Response:
+        try:
+            return await super().run(request, *args, **kwargs)
+        except PersistedQueryError as e:
+            # APQ clients expect a regular GraphQL error to retry with the query
+            error = {"message": e.message, "extensions": {"code": e.code}}
+            return JSONResponse({"data": None, "errors": [error]})
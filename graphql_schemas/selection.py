@@ -0,0 +1,20 @@
+import typing
+
+from strawberry.types import Info
+from strawberry.types.nodes import SelectedField, Selection
+
+
+def _collect(selections: typing.List[Selection], names: typing.Set[str]):
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            names.add(selection.name)
+        else:
+            _collect(selection.selections, names)
+
+
+def selected_field_names(info: Info) -> typing.Set[str]:
+    """Names selected directly under the current field, fragments included."""
+    names: typing.Set[str] = set()
+    for field in info.selected_fields:
+        _collect(field.selections, names)
+    return names
@@ -4,3 +4,4 @@ import strawberry
 @strawberry.type
 class UserQL:
     id: int
+    email: str
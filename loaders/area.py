@@ -1,31 +1,69 @@
 import typing
 
-from area.crud import get_my_areas
-from graphql_schemas.area import Area as AreaSchema, Room as RoomSchema
+from area.crud import (
+    get_my_areas,
+    get_areas_by_ids,
+    get_rooms_by_area_ids,
+    get_areas_near,
+)
+from graphql_schemas.area import Area as AreaSchema, Room as RoomSchema, NearbyArea
 from models.area import Area
 
 
+def to_area_schema(area: Area) -> AreaSchema:
+    return AreaSchema(
+        id=area.id,
+        created_at=area.created_at,
+        name=area.name,
+        latitude=area.latitude,
+        longtitude=area.longtitude,
+        address=area.address,
+        user_id=area.user_id,
+    )
+
+
 async def load_my_areas(
     user_id: int,
     limit: int,
     offset: int,
     keys: typing.Optional[typing.List[int]] = None,
-) -> typing.Tuple[typing.List[AreaSchema], int]:
-    result = await get_my_areas(user_id, limit, offset, keys)
+    with_items: bool = True,
+    with_count: bool = True,
+) -> typing.Tuple[typing.List[AreaSchema], typing.Optional[int]]:
+    result = await get_my_areas(user_id, limit, offset, keys, with_items, with_count)
     areas: typing.List[Area] = result[0]
-    count: int = result[1]
-    return [
-        AreaSchema(
-            id=area.id,
-            created_at=area.created_at,
-            name=area.name,
-            latitude=area.latitude,
-            longtitude=area.longtitude,
-            address=area.address,
-            rooms=[
-                RoomSchema(id=room.id, created_at=room.created_at, name=room.name)
-                for room in area.rooms
-            ],
+    count: typing.Optional[int] = result[1]
+    return [to_area_schema(area) for area in areas], count
+
+
+async def load_areas_by_ids(
+    user_id: int, keys: typing.List[int]
+) -> typing.List[AreaSchema | None]:
+    areas = {area.id: area for area in await get_areas_by_ids(user_id, keys)}
+    return [to_area_schema(areas[key]) if key in areas else None for key in keys]
+
+
+async def load_rooms_by_area_ids(
+    keys: typing.List[int],
+) -> typing.List[typing.List[RoomSchema]]:
+    rooms: typing.Dict[int, typing.List[RoomSchema]] = {key: [] for key in keys}
+    for room in await get_rooms_by_area_ids(keys):
+        rooms[room.area_id].append(
+            RoomSchema(
+                id=room.id,
+                created_at=room.created_at,
+                name=room.name,
+                area_id=room.area_id,
+            )
         )
-        for area in areas
-    ], count
+    return [rooms[key] for key in keys]
+
+
+async def load_areas_near(
+    user_id: int, latitude: float, longtitude: float, radius_km: float, limit: int
+) -> typing.List[NearbyArea]:
+    nearby = await get_areas_near(user_id, latitude, longtitude, radius_km, limit)
+    return [
+        NearbyArea(area=to_area_schema(area), distance_km=distance)
+        for area, distance in nearby
+    ]
@@ -0,0 +1,12 @@
+import typing
+
+from graphql_schemas.user import UserQL
+from user.crud import get_users_by_ids
+
+
+async def load_users_by_ids(keys: typing.List[int]) -> typing.List[UserQL | None]:
+    users = {user.id: user for user in await get_users_by_ids(keys)}
+    return [
+        UserQL(id=users[key].id, email=users[key].email) if key in users else None
+        for key in keys
+    ]
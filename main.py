@@ -1,29 +1,62 @@
 import strawberry
 import uvicorn
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi_pagination import add_pagination
-from strawberry.fastapi import GraphQLRouter
+from strawberry.extensions import (
+    MaxAliasesLimiter,
+    MaxTokensLimiter,
+    ParserCache,
+    QueryDepthLimiter,
+    ValidationCache,
+)
 
-from db.session import create_db_and_tables
+from config import settings
+from db.session import create_db_and_tables, dispose_engines
+from models.user import UserRole
 from graphql_schemas.context import Context
 from graphql_schemas.mutation import Mutation
 from graphql_schemas.query import Query
-from models.user import User
+from graphql_schemas.router import PersistedQueryRouter, persisted_queries
 from schemas.users_schemas import UserCreate, UserRead, UserUpdate
-from auth.auth import auth_backend, current_active_user, fastapi_users, get_user_manager
-from chat.chat import router as chat_router
+from auth.auth import (
+    auth_backend,
+    current_active_user,
+    fastapi_users,
+    token_cache,
+    UserSnapshot,
+)
+from area.area import router as area_router
+from chat.chat import (
+    router as chat_router,
+    manager,
+    user_rate_limiter,
+    chat_rate_limiter,
+)
+from chat.crud import membership_cache
+from chat.writer import message_writer
 
 app = FastAPI(title="WORKERS API")
 add_pagination(app)
 
 
-async def get_context(user_manager=Depends(get_user_manager)) -> Context:
-    return Context(user_manager)
+async def get_context() -> Context:
+    return Context()
 
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+schema = strawberry.Schema(
+    query=Query,
+    mutation=Mutation,
+    extensions=[
+        # token limit goes first: it sets the parser options ParserCache uses
+        MaxTokensLimiter(max_token_count=settings.graphql.max_tokens),
+        ParserCache(maxsize=settings.graphql.document_cache_size),
+        ValidationCache(maxsize=settings.graphql.document_cache_size),
+        QueryDepthLimiter(max_depth=settings.graphql.max_depth),
+        MaxAliasesLimiter(max_alias_count=settings.graphql.max_aliases),
+    ],
+)
 
-graphql_app = GraphQLRouter(
+graphql_app = PersistedQueryRouter(
     schema,
     context_getter=get_context,
 )
@@ -52,14 +85,46 @@ app.include_router(
     tags=["users"],
 )
 app.include_router(chat_router)
+app.include_router(area_router)
 app.include_router(graphql_app, prefix="/graphql")
 
 
 @app.get("/authenticated-route")
-async def authenticated_route(user: User = Depends(current_active_user)):
+async def authenticated_route(user: UserSnapshot = Depends(current_active_user)):
     return {"message": f"Hello {user.email}!"}
 
 
+@app.get("/stats")
+async def stats(user: UserSnapshot = Depends(current_active_user)):
+    """Per-process cache and rate limiter counters."""
+    if user.user_role != UserRole.manager:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    return {
+        "caches": {
+            "token": token_cache.stats(),
+            "membership": membership_cache.stats(),
+            "persisted_queries": persisted_queries.stats(),
+            "message_history": manager.history.stats(),
+        },
+        "rate_limiters": {
+            "user": user_rate_limiter.stats(),
+            "chat": chat_rate_limiter.stats(),
+        },
+    }
+
+
+@app.on_event("startup")
+async def start_chat_manager():
+    await manager.start()
+
+
+@app.on_event("shutdown")
+async def stop_chat_manager():
+    await manager.stop()
+    await message_writer.stop()
+    await dispose_engines()
+
+
 # @app.on_event("startup")
 # async def on_startup():
 #     # Not needed if you setup a migration system like Alembic
@@ -33,6 +33,16 @@ target_metadata = Base.metadata
 section = config.config_ini_section
 config.set_section_option(section, "DB_URL", settings.db.url_sync)
 
+# virtual tables created by raw DDL in their own revisions, together with the
+# shadow tables SQLite keeps for them; autogenerate must not drop them
+UNMANAGED_TABLES = ("area_rtree", "message_fts")
+
+
+def include_name(name, type_, parent_names):
+    if type_ == "table":
+        return not name.startswith(UNMANAGED_TABLES)
+    return True
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -50,6 +60,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -72,7 +83,11 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,41 @@
+"""direct chat key
+
+Revision ID: 112b91fdc61b
+Revises: 
+Create Date: 2026-10-18 12:02:01.953557
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "112b91fdc61b"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chat", sa.Column("direct_key", sa.String(length=64), nullable=True))
+    # key the oldest chat of every pair; younger duplicates keep a NULL key,
+    # they stay readable but POST /chat/ no longer returns them
+    op.execute(
+        "UPDATE chat SET direct_key = pair.direct_key FROM ("
+        "SELECT m.chat_id, min(m.user_id) || ':' || max(m.user_id) AS direct_key, "
+        "row_number() OVER ("
+        "PARTITION BY min(m.user_id), max(m.user_id) ORDER BY c.created_at, c.id"
+        ") AS position "
+        "FROM association_chat_members AS m JOIN chat AS c ON c.id = m.chat_id "
+        "GROUP BY m.chat_id HAVING count(*) = 2"
+        ") AS pair WHERE pair.chat_id = chat.id AND pair.position = 1"
+    )
+    op.create_index("ix_chat_direct_key", "chat", ["direct_key"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_direct_key", table_name="chat")
+    with op.batch_alter_table("chat") as batch_op:
+        batch_op.drop_column("direct_key")
@@ -0,0 +1,55 @@
+"""area rtree
+
+Revision ID: a461f76a1f5e
+Revises: 112b91fdc61b
+Create Date: 2026-10-18 12:02:41.335960
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a461f76a1f5e"
+down_revision: Union[str, None] = "112b91fdc61b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# kept in sync with models.area.AREA_RTREE_DDL, which create_all runs
+AREA_RTREE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS area_rtree "
+    "USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    "CREATE TRIGGER IF NOT EXISTS area_rtree_insert AFTER INSERT ON area BEGIN "
+    "INSERT INTO area_rtree VALUES "
+    "(new.id, new.latitude, new.latitude, new.longtitude, new.longtitude); END",
+    "CREATE TRIGGER IF NOT EXISTS area_rtree_update "
+    "AFTER UPDATE OF latitude, longtitude ON area BEGIN "
+    "UPDATE area_rtree SET min_lat = new.latitude, max_lat = new.latitude, "
+    "min_lon = new.longtitude, max_lon = new.longtitude WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS area_rtree_delete AFTER DELETE ON area BEGIN "
+    "DELETE FROM area_rtree WHERE id = old.id; END",
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for statement in AREA_RTREE_DDL:
+        op.execute(statement)
+    # areas inserted before the triggers existed
+    op.execute(
+        "INSERT INTO area_rtree "
+        "SELECT id, latitude, latitude, longtitude, longtitude FROM area "
+        "WHERE id NOT IN (SELECT id FROM area_rtree)"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for trigger in ("area_rtree_insert", "area_rtree_update", "area_rtree_delete"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS area_rtree")
@@ -0,0 +1,53 @@
+"""message fts
+
+Revision ID: 25fb6298dcf5
+Revises: a461f76a1f5e
+Create Date: 2026-10-18 12:03:14.084486
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "25fb6298dcf5"
+down_revision: Union[str, None] = "a461f76a1f5e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# kept in sync with models.chat.MESSAGE_FTS_DDL, which create_all runs
+MESSAGE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5("
+    "text, content='message', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN "
+    "INSERT INTO message_fts (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN "
+    "INSERT INTO message_fts (message_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF text ON message "
+    "BEGIN "
+    "INSERT INTO message_fts (message_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO message_fts (rowid, text) VALUES (new.id, new.text); END",
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for statement in MESSAGE_FTS_DDL:
+        op.execute(statement)
+    # index the messages written before the triggers existed
+    op.execute("INSERT INTO message_fts (message_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for trigger in ("message_fts_insert", "message_fts_delete", "message_fts_update"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS message_fts")
@@ -0,0 +1,63 @@
+"""read markers
+
+Revision ID: f6cc1f655d34
+Revises: fb09e5850d9e
+Create Date: 2026-10-18 12:04:24.110937
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f6cc1f655d34"
+down_revision: Union[str, None] = "fb09e5850d9e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "association_chat_members",
+        sa.Column(
+            "last_read_message_id", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+    op.add_column(
+        "association_chat_members",
+        sa.Column("unread_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_index(
+        "ix_association_chat_members_chat_id_user_id",
+        "association_chat_members",
+        ["chat_id", "user_id"],
+        unique=False,
+    )
+    # members have read their chats up to their own last message, the same
+    # rule the inbox counted by before the markers existed
+    op.execute(
+        "UPDATE association_chat_members SET last_read_message_id = own.last_id "
+        "FROM (SELECT chat_id, author_id, max(id) AS last_id FROM message "
+        "GROUP BY chat_id, author_id) AS own "
+        "WHERE own.chat_id = association_chat_members.chat_id "
+        "AND own.author_id = association_chat_members.user_id"
+    )
+    op.execute(
+        "UPDATE association_chat_members SET unread_count = ("
+        "SELECT count(*) FROM message "
+        "WHERE message.chat_id = association_chat_members.chat_id "
+        "AND message.id > association_chat_members.last_read_message_id "
+        "AND message.author_id != association_chat_members.user_id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_association_chat_members_chat_id_user_id",
+        table_name="association_chat_members",
+    )
+    with op.batch_alter_table("association_chat_members") as batch_op:
+        batch_op.drop_column("unread_count")
+        batch_op.drop_column("last_read_message_id")
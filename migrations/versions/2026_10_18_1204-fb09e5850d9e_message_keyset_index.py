@@ -0,0 +1,31 @@
+"""message keyset index
+
+Revision ID: fb09e5850d9e
+Revises: 25fb6298dcf5
+Create Date: 2026-10-18 12:04:04.597196
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "fb09e5850d9e"
+down_revision: Union[str, None] = "25fb6298dcf5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_message_chat_id_created_at_id",
+        "message",
+        ["chat_id", "created_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_message_chat_id_created_at_id", table_name="message")
@@ -1,6 +1,6 @@
 from decimal import Decimal
 
-from sqlalchemy import String, DECIMAL, ForeignKey
+from sqlalchemy import DDL, String, DECIMAL, ForeignKey, column, event, table
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base_model import Base, BaseDBMixin
@@ -24,3 +24,36 @@ class Room(BaseDBMixin, Base):
     name: Mapped[str] = mapped_column(String(100))
     area_id: Mapped[int] = mapped_column(ForeignKey("area.id"))
     area: Mapped["Area"] = relationship(back_populates="rooms")
+
+
+# R*Tree over area coordinates, kept in sync by triggers so that every insert
+# path (ORM, bulk import) is indexed; not part of the ORM metadata on purpose,
+# create_all runs the DDL below and migrated databases get it from revision
+# a461f76a1f5e
+area_rtree = table(
+    "area_rtree",
+    column("id"),
+    column("min_lat"),
+    column("max_lat"),
+    column("min_lon"),
+    column("max_lon"),
+)
+
+AREA_RTREE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS area_rtree "
+    "USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    "CREATE TRIGGER IF NOT EXISTS area_rtree_insert AFTER INSERT ON area BEGIN "
+    "INSERT INTO area_rtree VALUES "
+    "(new.id, new.latitude, new.latitude, new.longtitude, new.longtitude); END",
+    "CREATE TRIGGER IF NOT EXISTS area_rtree_update "
+    "AFTER UPDATE OF latitude, longtitude ON area BEGIN "
+    "UPDATE area_rtree SET min_lat = new.latitude, max_lat = new.latitude, "
+    "min_lon = new.longtitude, max_lon = new.longtitude WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS area_rtree_delete AFTER DELETE ON area BEGIN "
+    "DELETE FROM area_rtree WHERE id = old.id; END",
+)
+
+for statement in AREA_RTREE_DDL:
+    event.listen(
+        Area.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
@@ -2,7 +2,18 @@ import typing
 from datetime import datetime
 from uuid import UUID, uuid4
 
-from sqlalchemy import String, DateTime, func, ForeignKey
+from sqlalchemy import (
+    DDL,
+    String,
+    DateTime,
+    func,
+    ForeignKey,
+    Index,
+    column,
+    event,
+    literal_column,
+    table,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from models.base_model import BaseDBMixin, Base
@@ -14,6 +25,14 @@ if typing.TYPE_CHECKING:
 class AssociationChatMembers(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)
     chat_id: Mapped[UUID] = mapped_column(ForeignKey("chat.id"), primary_key=True)
+    # read marker and the number of other members' messages after it,
+    # maintained by the message write path
+    last_read_message_id: Mapped[int] = mapped_column(default=0, server_default="0")
+    unread_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_association_chat_members_chat_id_user_id", "chat_id", "user_id"),
+    )
 
 
 class Chat(Base):
@@ -21,6 +40,8 @@ class Chat(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
+    # "<min user id>:<max user id>" for 1:1 chats, unique so each pair has one chat
+    direct_key: Mapped[str | None] = mapped_column(String(64), unique=True, index=True)
     messages: Mapped[typing.List["Message"] | None] = relationship(
         back_populates="chat"
     )
@@ -39,3 +60,36 @@ class Message(BaseDBMixin, Base):
     text: Mapped[str] = mapped_column(String(1000))
     chat_id: Mapped[UUID] = mapped_column(ForeignKey("chat.id"))
     chat: Mapped["Chat"] = relationship(back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_message_chat_id_created_at_id", "chat_id", "created_at", "id"),
+    )
+
+
+# FTS5 index over message text; an external content table, so the text is
+# stored once in "message" and the triggers keep the index in sync for every
+# write path (single inserts, the batched writer, bulk loads); create_all
+# runs the DDL below, migrated databases get it from revision 25fb6298dcf5
+message_fts = table("message_fts", column("text"), column("rowid"))
+message_fts_rank = literal_column("bm25(message_fts)")
+
+MESSAGE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5("
+    "text, content='message', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN "
+    "INSERT INTO message_fts (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN "
+    "INSERT INTO message_fts (message_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF text ON message "
+    "BEGIN "
+    "INSERT INTO message_fts (message_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO message_fts (rowid, text) VALUES (new.id, new.text); END",
+)
+
+for statement in MESSAGE_FTS_DDL:
+    event.listen(
+        Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
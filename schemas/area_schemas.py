@@ -0,0 +1,48 @@
+import typing
+from datetime import datetime
+from decimal import Decimal
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class AreaSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    created_at: datetime
+    name: str
+    latitude: Decimal
+    longtitude: Decimal
+    address: str
+
+
+class NearbyAreaSchema(BaseModel):
+    area: AreaSchema
+    distance_km: float
+
+
+class RoomImportSchema(BaseModel):
+    name: str = Field(max_length=100)
+
+
+class AreaImportSchema(BaseModel):
+    name: str = Field(max_length=100)
+    latitude: Decimal = Field(ge=-90, le=90)
+    longtitude: Decimal = Field(ge=-180, le=180)
+    address: str = Field(max_length=200)
+    rooms: typing.List[RoomImportSchema] = []
+
+
+class ImportErrorSchema(BaseModel):
+    line: int
+    error: str
+
+
+class ImportProgressSchema(BaseModel):
+    chunk: int
+    lines: int
+    areas: int
+    rooms: int
+    # rejected lines, plus every area of a chunk the database refused
+    failed: int = 0
+    errors: typing.List[ImportErrorSchema] = []
+    done: bool = False
@@ -1,5 +1,6 @@
 import typing
 from enum import Enum
+from uuid import UUID
 
 from pydantic import BaseModel
 
@@ -10,6 +11,11 @@ class MessageType(str, Enum):
     connect_user: str = "connect"
     disconnect_user: str = "disconnect_user"
     send_message: str = "message"
+    presence: str = "presence"
+    subscribe: str = "subscribe"
+    unsubscribe: str = "unsubscribe"
+    error: str = "error"
+    read: str = "read"
 
 
 class UserRole(Enum):
@@ -20,6 +26,18 @@ class UserRole(Enum):
 
 class WebsocketMessage(BaseModel):
     type: MessageType = MessageType.send_message
+    # chat the frame belongs to, required on the multiplexed socket
+    chat_id: typing.Optional[UUID] = None
+    # subscribe: replay only the buffered messages newer than this id
+    since: typing.Optional[int] = None
+    # read: last message read, the latest one when omitted
+    message_id: typing.Optional[int] = None
     user: typing.Optional[ShortUserRead] = None
     message: str = ""
     online_users: typing.Optional[typing.List[ShortUserRead]] = None
+    # connect: the replay before this frame left out older messages (newer
+    # than since, if given); page them with /chat/{chat_id}/messages/cursor
+    truncated: typing.Optional[bool] = None
+    # presence deltas, online_users is only sent to a freshly connected socket
+    joined: typing.Optional[typing.List[ShortUserRead]] = None
+    left: typing.Optional[typing.List[ShortUserRead]] = None
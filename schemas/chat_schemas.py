@@ -5,7 +5,7 @@ from uuid import UUID
 from pydantic import BaseModel, ConfigDict
 
 from schemas.users_schemas import UserRead, ShortUserRead
-from utils.pagiantion import PaginationSchema
+from utils.pagiantion import PaginationSchema, CursorSchema
 
 
 class MessageSchema(BaseModel):
@@ -28,3 +28,44 @@ class ChatSchema(BaseModel):
 
 class PaginationChatSchema(PaginationSchema, ChatSchema):
     pass
+
+
+class MessageCursorPage(CursorSchema):
+    items: typing.List[MessageSchema] = []
+
+
+class InboxChatSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: UUID
+    created_at: datetime
+    last_activity: datetime
+    last_message: typing.Optional[MessageSchema] = None
+    chat_members: typing.List[ShortUserRead] = []
+    unread_count: int = 0
+
+
+class InboxPage(CursorSchema):
+    items: typing.List[InboxChatSchema] = []
+
+
+class MessageSearchResult(BaseModel):
+    message: MessageSchema
+    # HTML-escaped excerpt with matched terms wrapped in <mark>
+    snippet: str
+    rank: float
+
+
+class MessageSearchPage(CursorSchema):
+    items: typing.List[MessageSearchResult] = []
+
+
+class UnreadCounterSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    chat_id: UUID
+    last_read_message_id: int
+    unread_count: int
+
+
+class UnreadSummary(BaseModel):
+    total: int
+    chats: typing.List[UnreadCounterSchema] = []
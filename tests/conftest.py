@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+# settings are read when the app is imported, point them at a scratch database
+_db_path = os.path.join(tempfile.mkdtemp(prefix="tests-"), "test.sqlite3")
+os.environ["DB__URL"] = f"sqlite+aiosqlite:///{_db_path}"
+os.environ["DB__URL_SYNC"] = f"sqlite:///{_db_path}"
+os.environ["DB__ECHO"] = "false"
+
+# imported only now, once the settings point at the scratch database
+import typing
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert
+
+from db.session import async_session_maker, create_db_and_tables
+from models.user import User
+
+
+@pytest.fixture
+def create_users() -> typing.Callable[[int], typing.Awaitable[typing.List[User]]]:
+    """Inserts ``count`` active users, lowest id first. Every call gets its
+    own email prefix, so tests sharing the scratch database never collide."""
+
+    async def create(count: int) -> typing.List[User]:
+        await create_db_and_tables()
+        prefix = uuid4().hex[:12]
+        async with async_session_maker() as session:
+            result = await session.execute(
+                insert(User).returning(User),
+                [
+                    {
+                        "email": f"{prefix}-{i}@example.com",
+                        "hashed_password": "-",
+                        "is_active": True,
+                        "is_superuser": False,
+                        "is_verified": True,
+                    }
+                    for i in range(count)
+                ],
+            )
+            users = sorted(result.scalars().all(), key=lambda user: user.id)
+            await session.commit()
+        return users
+
+    return create
@@ -0,0 +1,30 @@
+import asyncio
+
+from chat.connection import Connection, OverflowPolicy
+
+
+class StuckWebSocket:
+    """A client that never finishes reading a frame."""
+
+    async def send_text(self, message: str):
+        await asyncio.Event().wait()
+
+
+def test_stop_releases_publishers_blocked_on_a_full_queue():
+    async def scenario():
+        connection = Connection(StuckWebSocket(), None, 1, OverflowPolicy.block)
+        connection.start()
+        # one frame is stuck in the writer, one fills the queue
+        await connection.send("first")
+        await asyncio.sleep(0)
+        await connection.send("second")
+        publishers = [
+            asyncio.create_task(connection.send(f"blocked {i}")) for i in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        assert not any(publisher.done() for publisher in publishers)
+        connection.stop()
+        await asyncio.wait_for(asyncio.gather(*publishers), 0.5)
+        assert connection.queue.qsize() == 1
+
+    asyncio.run(scenario())
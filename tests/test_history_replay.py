@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from auth.auth import get_jwt_strategy, UserSnapshot
+from chat.backplane import InProcessBackplane
+from chat.chat import ConnectionManager
+from chat.connection import Connection, OverflowPolicy
+from chat.crud import create_chat_in_db, create_messages
+from chat.history import MessageHistory
+from config import settings
+from main import app
+from models.user import UserRole
+
+
+async def create_chat_with_messages(create_users, count: int):
+    users = await create_users(2)
+    chat = await create_chat_in_db(users[0].id, users[1].id)
+    messages = await create_messages(
+        [
+            {"chat_id": chat.id, "author_id": users[1].id, "text": f"message {i}"}
+            for i in range(count)
+        ]
+    )
+    token = await get_jwt_strategy().write_token(users[0])
+    return chat.id, [message.id for message in messages], token
+
+
+def replay(client, chat_id, token, since=None):
+    url = f"/chat/ws/{chat_id}"
+    if since is not None:
+        url += f"?since={since}"
+    frames = []
+    with client.websocket_connect(url, headers={"Authorization": token}) as websocket:
+        while True:
+            frame = json.loads(websocket.receive_text())
+            if frame.get("type") == "connect":
+                return frames, frame["truncated"]
+            frames.append(frame)
+
+
+def test_connect_frame_flags_a_replay_that_misses_messages(create_users):
+    size = settings.chat.history_size
+    chat_id, ids, token = asyncio.run(
+        create_chat_with_messages(create_users, size + 10)
+    )
+    with TestClient(app) as client:
+        frames, truncated = replay(client, chat_id, token)
+        assert [frame["id"] for frame in frames] == ids[-size:]
+        assert truncated
+        # the buffer no longer holds the messages right after this one
+        frames, truncated = replay(client, chat_id, token, since=ids[0])
+        assert len(frames) == size
+        assert truncated
+        frames, truncated = replay(client, chat_id, token, since=ids[-5])
+        assert [frame["id"] for frame in frames] == ids[-4:]
+        assert not truncated
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, message: str):
+        self.frames.append(json.loads(message))
+
+
+def test_a_message_dispatched_after_the_buffer_loaded_is_replayed_once(
+    create_users,
+):
+    async def scenario():
+        chat_id, ids, _ = await create_chat_with_messages(create_users, 3)
+        history = MessageHistory(10, 10, 60)
+        manager = ConnectionManager(InProcessBackplane(), history=history)
+        # the last message was committed before the buffer was loaded,
+        # its dispatch arrives afterwards
+        websocket = RecordingWebSocket()
+        user = UserSnapshot(1, "late@example.com", True, UserRole.client)
+        connection = Connection(websocket, user, 16, OverflowPolicy.drop_oldest)
+        connection.start()
+        await manager.subscribe(connection, chat_id)
+        late = (await history.recent(chat_id))[0][-1][1]
+        await manager.send_in_group(late, chat_id, ids[-1])
+        await manager.send_in_group('{"id": 0}', chat_id, ids[-1] + 1)
+        await asyncio.sleep(0.05)
+        frames, _ = await history.recent(chat_id)
+        await manager.close(connection)
+        await manager.stop()
+        return ids, [message_id for message_id, _ in frames], websocket.frames
+
+    ids, buffered, frames = asyncio.run(scenario())
+    assert buffered == ids + [ids[-1] + 1]
+    assert [frame["id"] for frame in frames if "id" in frame] == ids + [0]
+
+
+def test_a_message_dispatched_out_of_order_takes_its_place(create_users):
+    async def scenario():
+        chat_id, ids, _ = await create_chat_with_messages(create_users, 2)
+        history = MessageHistory(10, 10, 60)
+        manager = ConnectionManager(InProcessBackplane(), history=history)
+        await history.recent(chat_id)
+        # this worker's message is dispatched before an older one polled
+        # from another worker
+        await manager.send_in_group('{"id": 2}', chat_id, ids[-1] + 2)
+        websocket = RecordingWebSocket()
+        user = UserSnapshot(1, "order@example.com", True, UserRole.client)
+        connection = Connection(websocket, user, 16, OverflowPolicy.drop_oldest)
+        connection.start()
+        await manager.subscribe(connection, chat_id)
+        await manager.send_in_group('{"id": 1}', chat_id, ids[-1] + 1)
+        await asyncio.sleep(0.05)
+        frames, complete = await history.recent(chat_id)
+        await manager.close(connection)
+        await manager.stop()
+        return ids, [message_id for message_id, _ in frames], complete, websocket
+
+    ids, buffered, complete, websocket = asyncio.run(scenario())
+    assert buffered == ids + [ids[-1] + 1, ids[-1] + 2]
+    assert complete
+    assert [frame["id"] for frame in websocket.frames if "id" in frame] == ids + [
+        2,
+        1,
+    ]
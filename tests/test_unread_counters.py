@@ -0,0 +1,78 @@
+import asyncio
+from uuid import uuid4
+
+from sqlalchemy import insert, select
+
+from chat.crud import create_messages, mark_chat_read
+from db.session import async_session_maker
+from models.chat import AssociationChatMembers, Chat
+
+
+async def create_group_chat(create_users, members: int):
+    users = [user.id for user in await create_users(members)]
+    async with async_session_maker() as session:
+        chat_id = uuid4()
+        await session.execute(insert(Chat).values(id=chat_id))
+        await session.execute(
+            insert(AssociationChatMembers),
+            [{"chat_id": chat_id, "user_id": user} for user in users],
+        )
+        await session.commit()
+    return chat_id, users
+
+
+async def counters(chat_id):
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(AssociationChatMembers).filter_by(chat_id=chat_id)
+        )
+        return {
+            member.user_id: (member.last_read_message_id, member.unread_count)
+            for member in result.scalars()
+        }
+
+
+def test_unread_counters_follow_interleaved_batches_and_read_markers(create_users):
+    async def scenario():
+        chat_id, (a, b, c, d) = await create_group_chat(create_users, 4)
+        # one batch with runs by several authors, d never writes in it
+        messages = await create_messages(
+            [
+                {"chat_id": chat_id, "author_id": author, "text": str(i)}
+                for i, author in enumerate([a, a, b, a, c])
+            ]
+        )
+        ids = [message.id for message in messages]
+        after_batch = await counters(chat_id)
+        await mark_chat_read(chat_id, d, ids[1])
+        # past the latest message, clamped to it
+        await mark_chat_read(chat_id, b, ids[-1] + 100)
+        # markers never move back
+        await mark_chat_read(chat_id, a, ids[0])
+        after_reads = await counters(chat_id)
+        (reply,) = await create_messages(
+            [{"chat_id": chat_id, "author_id": d, "text": "reply"}]
+        )
+        after_reply = await counters(chat_id)
+        return (a, b, c, d), ids, reply.id, after_batch, after_reads, after_reply
+
+    users, ids, reply, after_batch, after_reads, after_reply = asyncio.run(scenario())
+    a, b, c, d = users
+    assert after_batch == {
+        a: (ids[3], 1),
+        b: (ids[2], 2),
+        c: (ids[4], 0),
+        d: (0, 5),
+    }
+    assert after_reads == {
+        a: (ids[3], 1),
+        b: (ids[4], 0),
+        c: (ids[4], 0),
+        d: (ids[1], 3),
+    }
+    assert after_reply == {
+        a: (ids[3], 2),
+        b: (ids[4], 1),
+        c: (ids[4], 1),
+        d: (reply, 0),
+    }
@@ -0,0 +1,41 @@
+import asyncio
+import contextlib
+import json
+
+from fastapi.testclient import TestClient
+
+from auth.auth import get_jwt_strategy
+from chat.crud import create_chat_in_db
+from db.session import engine, read_engine
+from main import app
+
+SOCKETS = 20
+
+
+async def create_users_and_chat(create_users):
+    users = await create_users(2)
+    chat = await create_chat_in_db(users[0].id, users[1].id)
+    token = await get_jwt_strategy().write_token(users[0])
+    return chat.id, token
+
+
+def checked_out() -> int:
+    pools = {id(engine.pool): engine.pool, id(read_engine.pool): read_engine.pool}
+    return sum(pool.checkedout() for pool in pools.values())
+
+
+def test_websocket_auth_does_not_hold_pool_connections(create_users):
+    chat_id, token = asyncio.run(create_users_and_chat(create_users))
+    with TestClient(app) as client, contextlib.ExitStack() as sockets:
+        before = checked_out()
+        for _ in range(SOCKETS):
+            websocket = sockets.enter_context(
+                client.websocket_connect(
+                    f"/chat/ws/{chat_id}", headers={"Authorization": token}
+                )
+            )
+            # the handshake, access check and subscribe are done once the
+            # socket got its connect frame
+            while json.loads(websocket.receive_text())["type"] != "connect":
+                pass
+            assert checked_out() == before
@@ -0,0 +1,16 @@
+import typing
+
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+
+from db.session import async_read_session_maker
+from models.user import User
+
+
+async def get_users_by_ids(ids: typing.List[int]):
+    async with async_read_session_maker() as session:
+        stmt = (
+            select(User).where(User.id.in_(ids)).options(load_only(User.id, User.email))
+        )
+        results = await session.execute(stmt)
+    return results.scalars().all()
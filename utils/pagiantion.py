@@ -1,3 +1,8 @@
+import base64
+import json
+import typing
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -5,3 +10,30 @@ class PaginationSchema(BaseModel):
     limit: int
     offset: int
     count: int
+
+
+class CursorSchema(BaseModel):
+    before: typing.Optional[str] = None
+    after: typing.Optional[str] = None
+
+
+def _json_default(value: typing.Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(*values: typing.Any) -> str:
+    raw = json.dumps(values, default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> typing.List[typing.Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
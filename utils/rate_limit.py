@@ -0,0 +1,45 @@
+import time
+import typing
+from collections import OrderedDict
+
+K = typing.TypeVar("K")
+
+
+class RateLimiter(typing.Generic[K]):
+    """Token bucket per key: ``burst`` tokens at most, refilled at ``rate``
+    tokens per second.
+
+    Buckets live in a bounded LRU; an evicted key simply starts again with
+    a full bucket. ``allowed``/``rejected`` count the decisions taken."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.allowed = 0
+        self.rejected = 0
+        # key -> (tokens, monotonic time of the last refill)
+        self._buckets: typing.OrderedDict[K, typing.Tuple[float, float]] = OrderedDict()
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+    def allow(self, key: K, cost: float = 1) -> bool:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed